@@ -0,0 +1,190 @@
+"""create_partitioned_product_tables
+
+Revision ID: 5b1d7c3a9f20
+Revises: e26560f25ae0
+Create Date: 2026-10-19 10:12:41.503117
+
+Creates hash partitioned copies of product and product_category_association
+next to the live tables and keeps them in sync with triggers. Existing rows
+are copied online by `python partition_tables.py backfill`, after which
+revision 8e4a2f6c1d93 swaps the tables.
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+from config import (
+    ASSOCIATION_CATEGORY_RANGE,
+    ASSOCIATION_PARTITIONING,
+    PRODUCT_PARTITIONS,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1d7c3a9f20'
+down_revision: Union[str, None] = 'e26560f25ae0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# One statement per item, asyncpg prepares statements and rejects batches
+SYNC_TRIGGERS = [
+    """
+CREATE FUNCTION product_partitioned_sync() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM product_partitioned WHERE id = OLD.id;
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'UPDATE' AND NEW.id <> OLD.id THEN
+        DELETE FROM product_partitioned WHERE id = OLD.id;
+    END IF;
+
+    INSERT INTO product_partitioned (id, name, price)
+    VALUES (NEW.id, NEW.name, NEW.price)
+    ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, price = EXCLUDED.price;
+
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""",
+    """
+CREATE FUNCTION product_category_association_partitioned_sync() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM product_category_association_partitioned
+        WHERE product_id = OLD.product_id AND category_id = OLD.category_id;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        RETURN NULL;
+    END IF;
+
+    IF NEW.product_id IS NOT NULL AND NEW.category_id IS NOT NULL THEN
+        -- The product may not have been backfilled yet
+        INSERT INTO product_partitioned (id, name, price)
+        SELECT id, name, price FROM product WHERE id = NEW.product_id
+        ON CONFLICT (id) DO NOTHING;
+
+        INSERT INTO product_category_association_partitioned (product_id, category_id)
+        VALUES (NEW.product_id, NEW.category_id)
+        ON CONFLICT DO NOTHING;
+    END IF;
+
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""",
+    """
+CREATE TRIGGER product_partitioned_sync
+AFTER INSERT OR UPDATE OR DELETE ON product
+FOR EACH ROW EXECUTE FUNCTION product_partitioned_sync()
+""",
+    """
+CREATE TRIGGER product_category_association_partitioned_sync
+AFTER INSERT OR UPDATE OR DELETE ON product_category_association
+FOR EACH ROW EXECUTE FUNCTION product_category_association_partitioned_sync()
+""",
+]
+
+
+# Progress of `python partition_tables.py backfill`. Products above
+# trigger_start_id were written after the triggers existed and are synced by
+# them, the swap only has to check that the backfill got that far.
+BACKFILL_PROGRESS = [
+    """
+CREATE TABLE product_partition_backfill (
+    trigger_start_id INTEGER NOT NULL,
+    copied_up_to INTEGER NOT NULL DEFAULT 0
+)
+""",
+    # The triggers' lock on product holds off writers until commit, no
+    # product can slip in between the triggers and this max(id)
+    """
+INSERT INTO product_partition_backfill (trigger_start_id)
+SELECT coalesce(max(id), 0) FROM product
+""",
+]
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE product_partitioned (
+            id INTEGER NOT NULL,
+            name VARCHAR NOT NULL,
+            price FLOAT NOT NULL,
+            CONSTRAINT product_partitioned_pkey PRIMARY KEY (id)
+        ) PARTITION BY HASH (id)
+    """)
+    for remainder in range(PRODUCT_PARTITIONS):
+        op.execute(
+            f"CREATE TABLE product_p{remainder} PARTITION OF product_partitioned "
+            f"FOR VALUES WITH (MODULUS {PRODUCT_PARTITIONS}, REMAINDER {remainder})"
+        )
+
+    if ASSOCIATION_PARTITIONING == "range":
+        partition_by = "RANGE (category_id)"
+    else:
+        partition_by = "HASH (product_id)"
+
+    op.execute(f"""
+        CREATE TABLE product_category_association_partitioned (
+            product_id INTEGER NOT NULL REFERENCES product_partitioned (id),
+            category_id INTEGER NOT NULL REFERENCES category (id),
+            CONSTRAINT product_category_association_partitioned_pkey
+                PRIMARY KEY (product_id, category_id)
+        ) PARTITION BY {partition_by}
+    """)
+
+    if ASSOCIATION_PARTITIONING == "range":
+        if context.is_offline_mode():
+            # No database to ask, every later category goes to the default
+            max_category_id = 0
+        else:
+            max_category_id = op.get_bind().execute(
+                sa.text("SELECT coalesce(max(id), 0) FROM category")
+            ).scalar()
+        for number, lower in enumerate(
+            range(0, max_category_id + 1, ASSOCIATION_CATEGORY_RANGE)
+        ):
+            op.execute(
+                f"CREATE TABLE product_category_association_p{number} "
+                f"PARTITION OF product_category_association_partitioned "
+                f"FOR VALUES FROM ({lower}) TO ({lower + ASSOCIATION_CATEGORY_RANGE})"
+            )
+        # Categories created later land here until new ranges are attached
+        op.execute(
+            "CREATE TABLE product_category_association_default "
+            "PARTITION OF product_category_association_partitioned DEFAULT"
+        )
+    else:
+        for remainder in range(PRODUCT_PARTITIONS):
+            op.execute(
+                f"CREATE TABLE product_category_association_p{remainder} "
+                f"PARTITION OF product_category_association_partitioned "
+                f"FOR VALUES WITH (MODULUS {PRODUCT_PARTITIONS}, REMAINDER {remainder})"
+            )
+
+    op.execute(
+        "CREATE INDEX ix_product_category_association_category_id "
+        "ON product_category_association_partitioned (category_id, product_id)"
+    )
+
+    for statement in SYNC_TRIGGERS + BACKFILL_PROGRESS:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE product_partition_backfill")
+    op.execute(
+        "DROP TRIGGER product_category_association_partitioned_sync "
+        "ON product_category_association"
+    )
+    op.execute("DROP TRIGGER product_partitioned_sync ON product")
+    op.execute("DROP FUNCTION product_category_association_partitioned_sync()")
+    op.execute("DROP FUNCTION product_partitioned_sync()")
+    op.execute("DROP TABLE product_category_association_partitioned")
+    op.execute("DROP TABLE product_partitioned")
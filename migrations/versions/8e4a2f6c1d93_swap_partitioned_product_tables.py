@@ -0,0 +1,196 @@
+"""swap_partitioned_product_tables
+
+Revision ID: 8e4a2f6c1d93
+Revises: 5b1d7c3a9f20
+Create Date: 2026-10-19 10:47:05.216384
+
+Replaces product and product_category_association with their partitioned
+copies. Run `python partition_tables.py backfill` and then `verify` first.
+Under its lock the migration only checks what the sync triggers cannot
+have covered and refuses to swap while the backfill is behind. The old
+tables are kept as
+product_legacy and product_category_association_legacy for rollback and
+can be dropped once the partitioned tables are trusted. The legacy
+association loses its foreign keys, otherwise deleting a category it still
+references would fail until then. downgrade adds them back.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+from alembic.script import ScriptDirectory
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4a2f6c1d93'
+down_revision: Union[str, None] = '5b1d7c3a9f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# A DO block so it also guards `alembic upgrade --sql` scripts. Writes since
+# the triggers were created are synced by them, products the backfill had not
+# reached are the only ones that can be missing. Above copied_up_to only rows
+# written after the last batch remain, a short range scan on both tables.
+CHECK_BACKFILL = """
+DO $$
+DECLARE
+    trigger_start INTEGER;
+    copied INTEGER;
+BEGIN
+    SELECT b.trigger_start_id, b.copied_up_to INTO trigger_start, copied
+    FROM product_partition_backfill AS b;
+
+    IF copied < trigger_start
+        OR EXISTS (
+            SELECT 1 FROM product
+            WHERE product.id > copied AND NOT EXISTS (
+                SELECT 1 FROM product_partitioned AS p WHERE p.id = product.id
+            )
+        )
+        OR EXISTS (
+            SELECT 1 FROM product_category_association AS a
+            WHERE a.product_id > copied
+            AND a.category_id IS NOT NULL
+            AND NOT EXISTS (
+                SELECT 1 FROM product_category_association_partitioned AS p
+                WHERE p.product_id = a.product_id AND p.category_id = a.category_id
+            )
+        )
+    THEN
+        RAISE EXCEPTION 'Product tables are not copied yet, run backfill first';
+    END IF;
+END
+$$
+"""
+
+
+# Created with the table in e26560f25ae0, their names did not change with it
+LEGACY_FOREIGN_KEYS = {
+    "product_category_association_category_id_fkey": (
+        "FOREIGN KEY (category_id) REFERENCES category (id)"
+    ),
+    "product_category_association_product_id_fkey": (
+        "FOREIGN KEY (product_id) REFERENCES product_legacy (id)"
+    ),
+}
+
+
+def rename_tables(live: str, replacement: str, retired: str) -> None:
+    op.execute(f"ALTER TABLE {live} RENAME TO {retired}")
+    op.execute(f"ALTER TABLE {retired} RENAME CONSTRAINT {live}_pkey TO {retired}_pkey")
+    op.execute(f"ALTER TABLE {replacement} RENAME TO {live}")
+    op.execute(
+        f"ALTER TABLE {live} RENAME CONSTRAINT {replacement}_pkey TO {live}_pkey"
+    )
+
+
+def upgrade() -> None:
+    # Writers wait until the swap commits. The full completeness check is
+    # `python partition_tables.py verify`, run before without the lock
+    op.execute(
+        "LOCK TABLE product, product_category_association IN ACCESS EXCLUSIVE MODE"
+    )
+    op.execute(CHECK_BACKFILL)
+    op.execute("DROP TABLE product_partition_backfill")
+
+    op.execute(
+        "DROP TRIGGER product_category_association_partitioned_sync "
+        "ON product_category_association"
+    )
+    op.execute("DROP TRIGGER product_partitioned_sync ON product")
+    op.execute("DROP FUNCTION product_category_association_partitioned_sync()")
+    op.execute("DROP FUNCTION product_partitioned_sync()")
+
+    # The old association table has no primary key, only its name moves
+    op.execute(
+        "ALTER TABLE product_category_association "
+        "RENAME TO product_category_association_legacy"
+    )
+    op.execute(
+        "ALTER TABLE product_category_association_partitioned "
+        "RENAME TO product_category_association"
+    )
+    op.execute(
+        "ALTER TABLE product_category_association RENAME CONSTRAINT "
+        "product_category_association_partitioned_pkey "
+        "TO product_category_association_pkey"
+    )
+    rename_tables("product", "product_partitioned", "product_legacy")
+
+    # Nothing writes the legacy association any more, its rows must not keep
+    # categories and legacy products from being deleted
+    for constraint in LEGACY_FOREIGN_KEYS:
+        op.execute(
+            "ALTER TABLE product_category_association_legacy "
+            f"DROP CONSTRAINT {constraint}"
+        )
+
+    # New products keep drawing ids from the existing sequence
+    op.execute("ALTER TABLE product_legacy ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE product_id_seq OWNED BY product.id")
+    op.execute(
+        "ALTER TABLE product ALTER COLUMN id SET DEFAULT nextval('product_id_seq')"
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        "LOCK TABLE product, product_category_association IN ACCESS EXCLUSIVE MODE"
+    )
+
+    # Bring the legacy tables up to date with writes made since the swap
+    op.execute("DELETE FROM product_category_association_legacy")
+    op.execute("""
+        INSERT INTO product_legacy (id, name, price)
+        SELECT id, name, price FROM product
+        ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, price = EXCLUDED.price
+    """)
+    op.execute("""
+        INSERT INTO product_category_association_legacy (product_id, category_id)
+        SELECT product_id, category_id FROM product_category_association
+    """)
+    op.execute("""
+        DELETE FROM product_legacy
+        WHERE NOT EXISTS (SELECT 1 FROM product WHERE product.id = product_legacy.id)
+    """)
+
+    # The rows were just copied from the live tables, NOT VALID skips
+    # scanning them again under the lock. New writes are checked either way,
+    # VALIDATE CONSTRAINT can run later without blocking them
+    for constraint, definition in LEGACY_FOREIGN_KEYS.items():
+        op.execute(
+            "ALTER TABLE product_category_association_legacy "
+            f"ADD CONSTRAINT {constraint} {definition} NOT VALID"
+        )
+
+    op.execute("ALTER TABLE product ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE product_id_seq OWNED BY product_legacy.id")
+    op.execute(
+        "ALTER TABLE product_legacy "
+        "ALTER COLUMN id SET DEFAULT nextval('product_id_seq')"
+    )
+
+    rename_tables("product", "product_legacy", "product_partitioned")
+    op.execute(
+        "ALTER TABLE product_category_association RENAME CONSTRAINT "
+        "product_category_association_pkey "
+        "TO product_category_association_partitioned_pkey"
+    )
+    op.execute(
+        "ALTER TABLE product_category_association "
+        "RENAME TO product_category_association_partitioned"
+    )
+    op.execute(
+        "ALTER TABLE product_category_association_legacy "
+        "RENAME TO product_category_association"
+    )
+
+    # Keep the partitioned copies in sync again, as after 5b1d7c3a9f20. They
+    # were complete at this point, so is the backfill
+    module = ScriptDirectory.from_config(op.get_context().config).get_revision(
+        down_revision
+    ).module
+    for statement in module.SYNC_TRIGGERS + module.BACKFILL_PROGRESS:
+        op.execute(statement)
+    op.execute("UPDATE product_partition_backfill SET copied_up_to = trigger_start_id")
@@ -0,0 +1,54 @@
+"""add_product_category_ids
+
+Revision ID: c3f9a7e1b2d4
+Revises: 8e4a2f6c1d93
+Create Date: 2026-10-19 14:03:52.918264
+
+Adds product.category_ids empty, a constant default is a catalog only change.
+Ships with the code writing the column. Once that code is deployed,
+`python backfill_columns.py category-ids` fills the arrays online, builds the
+GIN index per partition and records its completion in column_backfill. Until
+then the read paths keep joining product_category_association.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f9a7e1b2d4'
+down_revision: Union[str, None] = '8e4a2f6c1d93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Names of the backfills that have completed, see src/backfills.py
+    op.create_table(
+        'column_backfill',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    op.add_column(
+        'product',
+        sa.Column(
+            'category_ids',
+            postgresql.ARRAY(sa.Integer()),
+            server_default='{}',
+            nullable=False,
+        ),
+    )
+    # ON ONLY creates no partition indexes, it stays invalid until the
+    # backfill attaches one per partition
+    op.execute(
+        "CREATE INDEX ix_product_category_ids ON ONLY product USING gin (category_ids)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_product_category_ids', table_name='product')
+    op.drop_column('product', 'category_ids')
+    op.drop_table('column_backfill')
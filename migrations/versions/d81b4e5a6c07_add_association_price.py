@@ -0,0 +1,47 @@
+"""add_association_price
+
+Revision ID: d81b4e5a6c07
+Revises: c3f9a7e1b2d4
+Create Date: 2026-10-19 16:21:37.640518
+
+Adds product_category_association.price as a nullable column, a catalog
+only change. Ships together with the code writing the column: code older
+than this revision does not write it and keeps working, its rows are left
+NULL. Once no older code is left running, `python backfill_columns.py
+association-price` fills the column in batches, builds the index per
+partition and makes the column NOT NULL. Sorted listings read the column
+only after that, product.price serves them until then.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81b4e5a6c07'
+down_revision: Union[str, None] = 'c3f9a7e1b2d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'product_category_association', sa.Column('price', sa.Float(), nullable=True)
+    )
+    # Invalid until the backfill attaches an index per partition
+    op.execute(
+        "CREATE INDEX ix_product_category_association_category_price "
+        "ON ONLY product_category_association (category_id, price, product_id)"
+    )
+
+
+def downgrade() -> None:
+    # Upgrading again needs the backfill again
+    op.execute("DELETE FROM column_backfill WHERE name = 'association_price'")
+    op.drop_index(
+        'ix_product_category_association_category_price',
+        table_name='product_category_association',
+    )
+    op.drop_column('product_category_association', 'price')
@@ -0,0 +1,214 @@
+"""Online backfill and indexing of columns added to the product tables.
+
+Migrations only add these columns and an invalid parent index, filling and
+indexing 100M+ rows inside the migration transaction would lock the tables
+for the whole run. Each migration ships with the code writing its column.
+Once no code older than it is left running:
+
+    python backfill_columns.py category-ids --batch-size 10000 --pause 0.1
+    python backfill_columns.py association-price --batch-size 10000 --pause 0.1
+
+Batches are keyed by product id and can be resumed with --after. Indexes are
+built per partition with CREATE INDEX CONCURRENTLY and attached to the parent
+index, which becomes valid once every partition has its index. A finished
+backfill is recorded in column_backfill, the read paths switch to the column
+then. Running a recorded backfill again does nothing.
+"""
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import exists, insert, select, text
+
+from backfills import ASSOCIATION_PRICE, CATEGORY_IDS, column_backfill
+from database import engine
+
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+
+BATCH_UPPER_BOUND = text("""
+    SELECT max(id) FROM (
+        SELECT id FROM product WHERE id > :after ORDER BY id LIMIT :batch_size
+    ) AS batch
+""")
+
+# Writers update the array and the association in one transaction, holding
+# the batch's rows keeps them from committing between the read and the write
+LOCK_PRODUCTS = text("""
+    SELECT id FROM product WHERE id > :after AND id <= :upper FOR UPDATE
+""")
+
+FILL_CATEGORY_IDS = text("""
+    UPDATE product SET category_ids = associated.category_ids
+    FROM (
+        SELECT product_id, array_agg(category_id) AS category_ids
+        FROM product_category_association
+        WHERE product_id > :after AND product_id <= :upper
+        GROUP BY product_id
+    ) AS associated
+    WHERE product.id = associated.product_id
+    AND product.id > :after AND product.id <= :upper
+""")
+
+# Only rows written before the code keeping the copy in sync was deployed
+FILL_ASSOCIATION_PRICE = text("""
+    UPDATE product_category_association SET price = product.price
+    FROM product
+    WHERE product_category_association.product_id = product.id
+    AND product_category_association.price IS NULL
+    AND product_category_association.product_id > :after
+    AND product_category_association.product_id <= :upper
+    AND product.id > :after AND product.id <= :upper
+""")
+
+# Added only now, the check would reject every write of code older than the
+# column. Adding it NOT VALID is a catalog change, VALIDATE then scans
+# without blocking writes, and SET NOT NULL trusts the valid check instead of
+# scanning again under its lock, so the check can go. Dropping it first lets
+# an interrupted run start over.
+ASSOCIATION_PRICE_NOT_NULL = [
+    text(
+        "ALTER TABLE product_category_association "
+        "DROP CONSTRAINT IF EXISTS ck_product_category_association_price_not_null"
+    ),
+    text(
+        "ALTER TABLE product_category_association "
+        "ADD CONSTRAINT ck_product_category_association_price_not_null "
+        "CHECK (price IS NOT NULL) NOT VALID"
+    ),
+    text(
+        "ALTER TABLE product_category_association "
+        "VALIDATE CONSTRAINT ck_product_category_association_price_not_null"
+    ),
+    text("ALTER TABLE product_category_association ALTER COLUMN price SET NOT NULL"),
+    text(
+        "ALTER TABLE product_category_association "
+        "DROP CONSTRAINT ck_product_category_association_price_not_null"
+    ),
+]
+
+PARTITIONS = text("""
+    SELECT inhrelid::regclass::text FROM pg_inherits
+    WHERE inhparent = CAST(:parent AS regclass)
+    ORDER BY 1
+""")
+
+
+async def fill_in_batches(statement, after: int, batch_size: int, pause: float):
+    while True:
+        # One short transaction per batch keeps row locks brief
+        async with engine.begin() as connection:
+            upper = await connection.scalar(
+                BATCH_UPPER_BOUND, {"after": after, "batch_size": batch_size}
+            )
+            if upper is None:
+                break
+
+            await connection.execute(LOCK_PRODUCTS, {"after": after, "upper": upper})
+            await connection.execute(statement, {"after": after, "upper": upper})
+
+        print(f"Filled products up to id {upper}")
+        after = upper
+        await asyncio.sleep(pause)
+
+
+async def index_partitions(
+    parent: str, parent_index: str, suffix: str, definition: str
+) -> None:
+    async with engine.connect() as connection:
+        # CONCURRENTLY cannot run inside a transaction
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        result = await connection.execute(PARTITIONS, {"parent": parent})
+
+        for partition in result.scalars().all():
+            index = f"{partition}_{suffix}"
+            await connection.execute(
+                text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} "
+                    f"ON {partition} {definition}"
+                )
+            )
+            # A no-op when the index is attached already, reruns are safe
+            await connection.execute(
+                text(f"ALTER INDEX {parent_index} ATTACH PARTITION {index}")
+            )
+            print(f"Indexed {partition}")
+
+
+async def completed(name: str) -> bool:
+    async with engine.connect() as connection:
+        return await connection.scalar(
+            select(exists().where(column_backfill.c.name == name))
+        )
+
+
+async def record_completed(name: str) -> None:
+    async with engine.begin() as connection:
+        await connection.execute(insert(column_backfill).values(name=name))
+    print(f"Recorded {name} as completed")
+
+
+async def category_ids(after: int, batch_size: int, pause: float):
+    await fill_in_batches(FILL_CATEGORY_IDS, after, batch_size, pause)
+    await index_partitions(
+        "product",
+        "ix_product_category_ids",
+        "category_ids_idx",
+        "USING gin (category_ids)",
+    )
+
+
+async def association_price(after: int, batch_size: int, pause: float):
+    await fill_in_batches(FILL_ASSOCIATION_PRICE, after, batch_size, pause)
+    await index_partitions(
+        "product_category_association",
+        "ix_product_category_association_category_price",
+        "category_price_idx",
+        "(category_id, price, product_id)",
+    )
+
+    for statement in ASSOCIATION_PRICE_NOT_NULL:
+        async with engine.begin() as connection:
+            await connection.execute(statement)
+    print("price is NOT NULL")
+
+
+COMMANDS = {
+    "category-ids": (CATEGORY_IDS, category_ids),
+    "association-price": (ASSOCIATION_PRICE, association_price),
+}
+
+
+async def run(command: str, after: int, batch_size: int, pause: float):
+    name, backfill = COMMANDS[command]
+    if await completed(name):
+        print(f"{name} is already backfilled")
+        return
+
+    await backfill(after, batch_size, pause)
+    await record_completed(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for command in COMMANDS:
+        command_parser = subparsers.add_parser(command)
+        command_parser.add_argument("--batch-size", type=int, default=10000)
+        command_parser.add_argument(
+            "--after", type=int, default=0, help="resume after this product id"
+        )
+        command_parser.add_argument(
+            "--pause", type=float, default=0.1, help="seconds to sleep between batches"
+        )
+
+    args = parser.parse_args()
+
+    asyncio.run(run(args.command, args.after, args.batch_size, args.pause))
+
+
+if __name__ == "__main__":
+    main()
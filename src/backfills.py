@@ -0,0 +1,46 @@
+"""Completion of the online column backfills run by backfill_columns.py.
+
+Migrations add denormalized columns empty, backfill_columns.py fills them
+after the code writing them is deployed and records its name here once done.
+Until then the read paths use the tables the columns are copied from.
+"""
+import time
+from typing import Dict, Set
+
+from sqlalchemy import Column, String, Table, exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import BACKFILL_RECHECK_INTERVAL
+from database import Base
+
+
+# Product.category_ids, copied from product_category_association
+CATEGORY_IDS = "category_ids"
+# product_category_association.price, copied from Product.price
+ASSOCIATION_PRICE = "association_price"
+
+column_backfill = Table(
+    "column_backfill", Base.metadata, Column("name", String, primary_key=True)
+)
+
+_completed: Set[str] = set()
+_checked_at: Dict[str, float] = {}
+
+
+async def backfill_completed(session: AsyncSession, name: str) -> bool:
+    # A completed backfill stays completed. A pending one is read again at
+    # most once per BACKFILL_RECHECK_INTERVAL seconds per process
+    if name in _completed:
+        return True
+
+    now = time.monotonic()
+    checked_at = _checked_at.get(name)
+    if checked_at is not None and now - checked_at < BACKFILL_RECHECK_INTERVAL:
+        return False
+    _checked_at[name] = now
+
+    if await session.scalar(select(exists().where(column_backfill.c.name == name))):
+        _completed.add(name)
+        return True
+
+    return False
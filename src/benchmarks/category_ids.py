@@ -0,0 +1,130 @@
+"""Compare reading product categories through the join and the array column.
+
+    python -m benchmarks.category_ids --category-id 1 --runs 20
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+from sqlalchemy import Integer, distinct, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from database import async_session_maker
+import models  # Registers every model so mappers can be configured
+from category.utils import category_subtree
+from product.models import Product, product_category_association
+
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+
+async def tree_by_join(session, category_id: int):
+    stmt = (
+        select(
+            Product.id,
+            Product.name,
+            Product.price,
+            product_category_association.c.category_id,
+        )
+        .join(
+            product_category_association,
+            Product.id == product_category_association.c.product_id,
+        )
+        .where(
+            product_category_association.c.category_id.in_(
+                category_subtree([category_id])
+            )
+        )
+    )
+    result = await session.execute(stmt)
+
+    products = {}
+    product_category_map = defaultdict(list)
+    for row in result:
+        products.setdefault(row.id, row)
+        product_category_map[row.id].append(row.category_id)
+
+    return [
+        {
+            "id": row.id,
+            "name": row.name,
+            "price": row.price,
+            "category_ids": product_category_map[product_id],
+        }
+        for product_id, row in products.items()
+    ]
+
+
+async def tree_by_array(session, category_id: int):
+    stmt = select(
+        Product.id, Product.name, Product.price, Product.category_ids
+    ).where(
+        Product.category_ids.overlap(
+            func.array(category_subtree([category_id]).scalar_subquery())
+        )
+    )
+    result = await session.execute(stmt)
+
+    return [
+        {
+            "id": row.id,
+            "name": row.name,
+            "price": row.price,
+            "category_ids": row.category_ids,
+        }
+        for row in result
+    ]
+
+
+async def count_by_join(session, category_ids):
+    stmt = select(
+        func.count(distinct(product_category_association.c.product_id))
+    ).where(product_category_association.c.category_id.in_(category_ids))
+    return (await session.execute(stmt)).scalar()
+
+
+async def count_by_array(session, category_ids):
+    stmt = select(func.count(Product.id)).where(
+        Product.category_ids.overlap(literal(category_ids, ARRAY(Integer)))
+    )
+    return (await session.execute(stmt)).scalar()
+
+
+async def measure(name, query, argument, runs: int):
+    timings = []
+    async with async_session_maker() as session:
+        rows = await query(session, argument)
+        for _ in range(runs):
+            started = time.perf_counter()
+            await query(session, argument)
+            timings.append(time.perf_counter() - started)
+
+    size = len(rows) if isinstance(rows, list) else rows
+    print(
+        f"{name:<16} result={size:<10} median={statistics.median(timings) * 1000:.2f}ms "
+        f"min={min(timings) * 1000:.2f}ms"
+    )
+
+
+async def run(category_id: int, runs: int):
+    await measure("tree by join", tree_by_join, category_id, runs)
+    await measure("tree by array", tree_by_array, category_id, runs)
+    await measure("count by join", count_by_join, [category_id], runs)
+    await measure("count by array", count_by_array, [category_id], runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--category-id", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.category_id, args.runs))
+
+
+if __name__ == "__main__":
+    main()
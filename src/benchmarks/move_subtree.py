@@ -0,0 +1,128 @@
+"""Time moving a large category subtree and rejecting a cyclic move.
+
+    python -m benchmarks.move_subtree --size 100000 --fanout 10 --runs 10
+
+Builds a subtree of --size categories under a fresh root, one set-based
+insert per level, and two fresh parents to move it between. Each run moves
+the subtree through move_category, which locks, checks the ancestors,
+commits and notifies like the endpoint, then tries to move the root under
+its deepest category. Everything the benchmark created is deleted afterwards.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from sqlalchemy import delete, insert, text
+
+from database import async_session_maker
+import models  # Registers every model so mappers can be configured
+from category.models import Category
+from category.schemas import CategoryMove
+from category.utils import category_subtree, move_category
+from exceptions import CategoryCycleError
+
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+
+NAME = "move benchmark"
+
+ADD_LEVEL = text("""
+    INSERT INTO category (name, parent_id)
+    SELECT :name, parent.id
+    FROM unnest(CAST(:parents AS INTEGER[])) AS parent(id), generate_series(1, :fanout)
+    LIMIT :limit
+    RETURNING id
+""")
+
+
+async def add_category(session) -> int:
+    return await session.scalar(
+        insert(Category).values(name=NAME).returning(Category.id)
+    )
+
+
+async def build_subtree(size: int, fanout: int):
+    """Returns the root, its deepest category and two parents to move between."""
+    async with async_session_maker() as session:
+        root = await add_category(session)
+        parents = (await add_category(session), await add_category(session))
+
+        level, created, depth = [root], 1, 0
+        while created < size:
+            result = await session.execute(
+                ADD_LEVEL,
+                {"name": NAME, "parents": level, "fanout": fanout, "limit": size - created},
+            )
+            level = result.scalars().all()
+            created += len(level)
+            depth += 1
+
+        await session.commit()
+
+    print(f"Built a subtree of {created} categories, {depth} levels deep")
+    return root, level[-1], parents
+
+
+async def remove_subtree(root: int, parents) -> None:
+    async with async_session_maker() as session:
+        # One statement, the parent_id references are checked at its end
+        await session.execute(
+            delete(Category).where(Category.id.in_(category_subtree([root])))
+        )
+        await session.execute(delete(Category).where(Category.id.in_(parents)))
+        await session.commit()
+
+
+async def measure(name, move, runs: int) -> None:
+    timings = []
+    for run in range(runs):
+        async with async_session_maker() as session:
+            started = time.perf_counter()
+            await move(session, run)
+            timings.append(time.perf_counter() - started)
+
+    print(
+        f"{name:<14} median={statistics.median(timings) * 1000:.2f}ms "
+        f"min={min(timings) * 1000:.2f}ms max={max(timings) * 1000:.2f}ms"
+    )
+
+
+async def run(size: int, fanout: int, runs: int):
+    root, deepest, parents = await build_subtree(size, fanout)
+
+    async def move_subtree(session, run: int):
+        await move_category(
+            session, root, CategoryMove(parent_id=parents[run % len(parents)])
+        )
+
+    async def reject_cycle(session, run: int):
+        try:
+            await move_category(session, root, CategoryMove(parent_id=deepest))
+        except CategoryCycleError:
+            await session.rollback()
+        else:
+            raise AssertionError("a move under the deepest category was accepted")
+
+    try:
+        await measure("move subtree", move_subtree, runs)
+        await measure("reject cycle", reject_cycle, runs)
+    finally:
+        await remove_subtree(root, parents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.size, args.fanout, args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Measure memory of the category tree read path, per 100k products.
+
+    python -m benchmarks.read_memory --category-id 1
+
+"orm" is the original path: Product entities in the identity map keyed into
+a dict, then a ProductRead per product and FastAPI's jsonable_encoder.
+"dicts" is get_products_by_category with a dict per row, "compact" the
+ProductRows path the router serves. tracemalloc reports the peak while
+reading and serializing, gc counts how many collections that triggered.
+"""
+import argparse
+import asyncio
+import gc
+import sys
+import tracemalloc
+from collections import defaultdict
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+
+from database import async_session_maker
+import models  # Registers every model so mappers can be configured
+from category.utils import category_subtree
+from product.models import Product, product_category_association
+from product.router import rows_response
+from product.schemas import ProductRead
+from product.utils import get_products_by_category
+
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+
+async def read_orm(session, category_id: int) -> int:
+    stmt = (
+        select(Product, product_category_association.c.category_id)
+        .join(
+            product_category_association,
+            Product.id == product_category_association.c.product_id,
+        )
+        .where(
+            product_category_association.c.category_id.in_(
+                category_subtree([category_id])
+            )
+        )
+    )
+    result = await session.execute(stmt)
+
+    product_category_map = defaultdict(list)
+    for product, product_category_id in result:
+        product_category_map[product].append(product_category_id)
+
+    products = [
+        ProductRead.model_validate(
+            {
+                "id": product.id,
+                "name": product.name,
+                "price": product.price,
+                "category_ids": category_ids,
+            }
+        )
+        for product, category_ids in product_category_map.items()
+    ]
+    body = JSONResponse(
+        jsonable_encoder({"status": "success", "data": products, "detail": None})
+    ).body
+    return len(products) if body else 0
+
+
+async def read_dicts(session, category_id: int) -> int:
+    products = await get_products_by_category(session=session, category_id=category_id)
+    body = JSONResponse(
+        jsonable_encoder({"status": "success", "data": products, "detail": None})
+    ).body
+    return len(products) if body else 0
+
+
+async def read_compact(session, category_id: int) -> int:
+    products = await get_products_by_category(
+        session=session, category_id=category_id, compact=True
+    )
+    body = rows_response(products).body
+    return len(products) if body else 0
+
+
+def collections() -> int:
+    return sum(generation["collections"] for generation in gc.get_stats())
+
+
+async def measure(name, read, category_id: int):
+    async with async_session_maker() as session:
+        # Warm up the connection and statement caches outside the measurement
+        await read(session, category_id)
+        session.expunge_all()
+        gc.collect()
+
+        collected = collections()
+        tracemalloc.start()
+        try:
+            rows = await read(session, category_id)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        collected = collections() - collected
+
+    scale = 100_000 / rows if rows else 0
+    print(
+        f"{name:<8} rows={rows:<10} peak={peak * scale / 2**20:.1f}MB "
+        f"gc collections={collected * scale:.0f} (per 100k rows)"
+    )
+
+
+async def run(category_id: int):
+    await measure("orm", read_orm, category_id)
+    await measure("dicts", read_dicts, category_id)
+    await measure("compact", read_compact, category_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--category-id", type=int, default=1)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.category_id))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Awaitable, TypeVar
+
+from fastapi import Request
+from sqlalchemy.exc import DBAPIError
+
+from config import DISCONNECT_POLL_INTERVAL
+from exceptions import ClientDisconnectedError, StatementTimeoutError
+
+
+T = TypeVar("T")
+
+# SQLSTATE of a statement cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+
+
+async def run_until_disconnected(request: Request, query: Awaitable[T]) -> T:
+    """Await a database call, cancelling it once the client goes away.
+
+    Cancelling the task makes asyncpg send a cancel request, so Postgres stops
+    the query instead of finishing the work for nobody. SQLAlchemy treats the
+    CancelledError as an exit exception and invalidates that connection rather
+    than returning it to the pool, the pool opens a new one when needed.
+    """
+    task = asyncio.ensure_future(query)
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if not task.done() and await request.is_disconnected():
+                task.cancel()
+                # The session must be idle again before the caller rolls back
+                await asyncio.wait({task})
+                if not task.cancelled():
+                    task.exception()
+                raise ClientDisconnectedError
+    finally:
+        if not task.done():
+            task.cancel()
+
+    try:
+        return task.result()
+    except DBAPIError as error:
+        if getattr(error.orig, "sqlstate", None) == QUERY_CANCELED:
+            raise StatementTimeoutError from error
+        raise
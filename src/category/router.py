@@ -1,20 +1,39 @@
-from typing import List
-from fastapi import APIRouter, Depends, Query
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError, NoResultFound
 
-from database import get_async_session
+from cancellation import run_until_disconnected
+from config import COUNT_STATEMENT_TIMEOUT, MAX_IDS_PER_REQUEST, STATEMENT_TIMEOUT
+from database import get_async_session, get_session_with_timeout
 
-from category.schemas import CategoryCreate, CategoryRead, CategoryUpdate
+from category.schemas import (
+    CATEGORY_COUNT_FIELDS,
+    CATEGORY_FIELDS,
+    CATEGORY_WITH_PRODUCTS_FIELDS,
+    CategoryCreate,
+    CategoryMove,
+    CategoryRead,
+    CategoryUpdate,
+)
 from category.utils import (
     create_category,
     delete_category,
     update_category,
+    move_category,
+    get_categories_by_ids,
     get_categories_for_products,
     get_categories_with_product_count,
 )
 
-from exceptions import basic_exception
+from exceptions import (
+    CategoryCycleError,
+    ClientDisconnectedError,
+    InvalidFieldsError,
+    StatementTimeoutError,
+    basic_exception,
+)
+from fields import parse_fields
 
 
 router = APIRouter()
@@ -62,11 +81,48 @@ async def category_update(
     except IntegrityError:
         await session.rollback()
         await basic_exception(status_code=400, message="Parent category does not exist")
+    except CategoryCycleError:
+        await session.rollback()
+        await basic_exception(
+            status_code=400, message="Category cannot be moved into its own subtree"
+        )
     except Exception:
         await session.rollback()
         await basic_exception(status_code=500, message="Error while creating category")
 
 
+@router.post("/{category_id}/move", response_model=dict)
+async def category_move(
+    category_id: int,
+    category: CategoryMove,
+    session: AsyncSession = Depends(get_async_session),
+):
+    try:
+        db_category = await move_category(
+            session=session, category_id=category_id, new_data=category
+        )
+
+        return {
+            "status": "success",
+            "data": CategoryRead.model_validate(db_category),
+            "detail": None,
+        }
+    except NoResultFound:
+        await session.rollback()
+        await basic_exception(status_code=404, message="Category does not exist")
+    except IntegrityError:
+        await session.rollback()
+        await basic_exception(status_code=400, message="Parent category does not exist")
+    except CategoryCycleError:
+        await session.rollback()
+        await basic_exception(
+            status_code=400, message="Category cannot be moved into its own subtree"
+        )
+    except Exception:
+        await session.rollback()
+        await basic_exception(status_code=500, message="Error while moving category")
+
+
 @router.delete("", response_model=dict)
 async def category_delete(
     category_id: int, session: AsyncSession = Depends(get_async_session)
@@ -91,26 +147,79 @@ async def category_delete(
         await basic_exception(status_code=500, message="Error while creating category")
 
 
+@router.get("", response_model=dict)
+async def categories_by_ids(
+    request: Request,
+    ids: List[int] = Query(max_length=MAX_IDS_PER_REQUEST),
+    fields: Optional[str] = None,
+    session: AsyncSession = Depends(get_session_with_timeout(STATEMENT_TIMEOUT)),
+):
+    try:
+        categories = await run_until_disconnected(
+            request,
+            get_categories_by_ids(
+                session=session,
+                category_ids=ids,
+                fields=parse_fields(fields, CATEGORY_WITH_PRODUCTS_FIELDS),
+            ),
+        )
+
+        if len(categories) != len(set(ids)):
+            raise NoResultFound
+
+        return {"status": "success", "data": categories, "detail": None}
+    except InvalidFieldsError:
+        await basic_exception(status_code=400, message="Unknown field requested")
+    except NoResultFound:
+        await session.rollback()
+        await basic_exception(status_code=404, message="One or more category not found")
+    except StatementTimeoutError:
+        await session.rollback()
+        await basic_exception(
+            status_code=504, message="Query took too long, request fewer ids"
+        )
+    except ClientDisconnectedError:
+        await session.rollback()
+        await basic_exception(status_code=499, message="Client closed request")
+    except Exception:
+        await session.rollback()
+        await basic_exception(status_code=500, message="Error while getting categories")
+
+
 @router.get("/by_product_ids", response_model=dict)
 async def categories_by_product_ids(
-    product_ids: List[int] = Query(), session: AsyncSession = Depends(get_async_session)
+    request: Request,
+    product_ids: List[int] = Query(max_length=MAX_IDS_PER_REQUEST),
+    fields: Optional[str] = None,
+    session: AsyncSession = Depends(get_session_with_timeout(STATEMENT_TIMEOUT)),
 ):
     try:
-        categories = await get_categories_for_products(
-            session=session, product_ids=product_ids
+        product_categories = await run_until_disconnected(
+            request,
+            get_categories_for_products(
+                session=session,
+                product_ids=product_ids,
+                fields=parse_fields(fields, CATEGORY_FIELDS),
+            ),
         )
 
-        if len(categories) != len(product_ids):
+        if len(product_categories) != len(set(product_ids)):
             raise NoResultFound
 
-        return {
-            "status": "success",
-            "data": [CategoryRead.model_validate(category) for category in categories],
-            "detail": None,
-        }
+        return {"status": "success", "data": product_categories, "detail": None}
+    except InvalidFieldsError:
+        await basic_exception(status_code=400, message="Unknown field requested")
     except NoResultFound:
         await session.rollback()
         await basic_exception(status_code=404, message="One or more product not found")
+    except StatementTimeoutError:
+        await session.rollback()
+        await basic_exception(
+            status_code=504, message="Query took too long, request fewer ids"
+        )
+    except ClientDisconnectedError:
+        await session.rollback()
+        await basic_exception(status_code=499, message="Client closed request")
     except Exception:
         await session.rollback()
         await basic_exception(status_code=500, message="Error while getting categories")
@@ -118,24 +227,39 @@ async def categories_by_product_ids(
 
 @router.get("/with_product_count", response_model=dict)
 async def categories_with_product_count(
-    category_ids: List[int] = Query(),
-    session: AsyncSession = Depends(get_async_session),
+    request: Request,
+    category_ids: List[int] = Query(max_length=MAX_IDS_PER_REQUEST),
+    fields: Optional[str] = None,
+    session: AsyncSession = Depends(get_session_with_timeout(COUNT_STATEMENT_TIMEOUT)),
 ):
     try:
-        categories = await get_categories_with_product_count(
-            session=session, category_ids=category_ids
+        categories = await run_until_disconnected(
+            request,
+            get_categories_with_product_count(
+                session=session,
+                category_ids=category_ids,
+                fields=parse_fields(fields, CATEGORY_COUNT_FIELDS),
+            ),
         )
 
-        retrieved_category_ids = [category["category_id"] for category in categories]
-
-        for cat_id in category_ids:
-            if cat_id not in retrieved_category_ids:
-                raise NoResultFound
+        # One row per existing category, the id may not be among the fields
+        if len(categories) != len(set(category_ids)):
+            raise NoResultFound
 
         return {"status": "success", "data": categories, "detail": None}
+    except InvalidFieldsError:
+        await basic_exception(status_code=400, message="Unknown field requested")
     except NoResultFound:
         await session.rollback()
         await basic_exception(status_code=404, message="One or more category not found")
+    except StatementTimeoutError:
+        await session.rollback()
+        await basic_exception(
+            status_code=504, message="Query took too long, request fewer ids"
+        )
+    except ClientDisconnectedError:
+        await session.rollback()
+        await basic_exception(status_code=499, message="Client closed request")
     except Exception:
         await session.rollback()
         await basic_exception(status_code=500, message="Error while getting categories")
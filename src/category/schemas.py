@@ -2,6 +2,12 @@ from typing import Optional
 from pydantic import BaseModel
 
 
+# Fields that can be requested through the fields= query parameter
+CATEGORY_FIELDS = ("id", "name", "parent_id")
+CATEGORY_WITH_PRODUCTS_FIELDS = CATEGORY_FIELDS + ("product_ids",)
+CATEGORY_COUNT_FIELDS = ("category_id", "category_name", "products_count")
+
+
 class CategoryBase(BaseModel):
     name: str
     parent_id: Optional[int] = None
@@ -20,3 +26,7 @@ class CategoryRead(CategoryBase):
 
 class CategoryUpdate(CategoryBase):
     name: Optional[str] = None
+
+
+class CategoryMove(BaseModel):
+    parent_id: Optional[int] = None
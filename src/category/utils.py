@@ -1,13 +1,29 @@
-from typing import List
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
 
-from sqlalchemy import func, select
+from sqlalchemy import Integer, any_, delete, func, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from category.schemas import CategoryCreate, CategoryUpdate
+from category.schemas import (
+    CATEGORY_COUNT_FIELDS,
+    CATEGORY_FIELDS,
+    CATEGORY_WITH_PRODUCTS_FIELDS,
+    CategoryCreate,
+    CategoryMove,
+    CategoryUpdate,
+)
+from backfills import CATEGORY_IDS, backfill_completed
 from category.models import Category
 
 from product.models import Product, product_category_association
 
+from database import any_id
+
+from events.utils import MAX_EVENT_IDS, OVERFLOW_EVENT, notify_catalog_change
+
+from exceptions import CategoryCycleError
+
 
 async def get_category(session: AsyncSession, category_id: int) -> Category:
     stmt = select(Category).filter_by(id=category_id)
@@ -16,12 +32,139 @@ async def get_category(session: AsyncSession, category_id: int) -> Category:
     return category.scalars().first()
 
 
+# Category columns that can be left out of the select list
+CATEGORY_COLUMNS = {"name": Category.name, "parent_id": Category.parent_id}
+
+
+def category_columns(fields: Sequence[str]):
+    # id is always selected, rows are grouped and matched by it
+    return [Category.id] + [
+        CATEGORY_COLUMNS[field] for field in fields if field in CATEGORY_COLUMNS
+    ]
+
+
+def category_row(row, fields: Sequence[str], product_ids: List[int] = None) -> dict:
+    return {
+        field: product_ids if field == "product_ids" else getattr(row, field)
+        for field in fields
+    }
+
+
+async def get_categories_by_ids(
+    session: AsyncSession,
+    category_ids: List[int],
+    fields: Sequence[str] = CATEGORY_WITH_PRODUCTS_FIELDS,
+) -> List[dict]:
+    categories = await session.execute(
+        select(*category_columns(fields)).where(Category.id == any_id(category_ids))
+    )
+    categories = {row.id: row for row in categories}
+
+    category_product_map = defaultdict(list)
+    if "product_ids" in fields:
+        associations = await session.execute(
+            select(
+                product_category_association.c.category_id,
+                product_category_association.c.product_id,
+            ).where(product_category_association.c.category_id == any_id(categories))
+        )
+        for category_id, product_id in associations:
+            category_product_map[category_id].append(product_id)
+
+    return [
+        category_row(category, fields, category_product_map[category.id])
+        for category in categories.values()
+    ]
+
+
+def category_subtree(category_ids: List[int]):
+    subtree = (
+        select(Category.id)
+        .where(Category.id.in_(category_ids))
+        .cte("subtree", recursive=True)
+    )
+    subtree = subtree.union(
+        select(Category.id).where(Category.parent_id == subtree.c.id)
+    )
+
+    return select(subtree.c.id)
+
+
+async def get_category_subtree_ids(
+    session: AsyncSession, category_ids: List[int], limit: Optional[int] = None
+) -> List[int]:
+    # Postgres evaluates the recursive CTE only as far as the limit needs
+    result = await session.execute(category_subtree(category_ids).limit(limit))
+    return [row.id for row in result]
+
+
+async def get_category_ancestor_ids(
+    session: AsyncSession, category_id: int
+) -> List[int]:
+    # Walks up from the category, so the cost is O(depth) not O(subtree)
+    ancestors = (
+        select(Category.id, Category.parent_id)
+        .where(Category.id == category_id)
+        .cte("ancestors", recursive=True)
+    )
+    ancestors = ancestors.union(
+        select(Category.id, Category.parent_id).where(
+            Category.id == ancestors.c.parent_id
+        )
+    )
+
+    result = await session.execute(select(ancestors.c.id))
+    return [row.id for row in result]
+
+
+async def check_category_parent(
+    session: AsyncSession, category_id: int, parent_id: Optional[int]
+) -> None:
+    if parent_id is None:
+        return
+
+    # Serialize tree moves, two concurrent moves could otherwise create a cycle
+    await session.execute(select(func.pg_advisory_xact_lock(func.hashtext("category"))))
+
+    if category_id in await get_category_ancestor_ids(session, parent_id):
+        raise CategoryCycleError
+
+
+def category_event(
+    category: Category, action: str, subtree_ids: Optional[List[int]] = None
+) -> dict:
+    event = {
+        "entity": "category",
+        "action": action,
+        "id": category.id,
+        "parent_id": category.parent_id,
+    }
+    if subtree_ids is not None:
+        # Set when the category moved, subscribers re-evaluate the whole subtree
+        event["subtree_ids"] = subtree_ids
+    return event
+
+
+async def category_move_event(session: AsyncSession, category: Category) -> dict:
+    # Reads one id past what an event can list. A bigger subtree is never
+    # loaded, every subscriber resyncs instead
+    subtree_ids = await get_category_subtree_ids(
+        session, [category.id], limit=MAX_EVENT_IDS + 1
+    )
+    if len(subtree_ids) > MAX_EVENT_IDS:
+        return OVERFLOW_EVENT
+
+    return category_event(category, "update", subtree_ids)
+
+
 async def create_category(
     session: AsyncSession, category_data: CategoryCreate
 ) -> Category:
     category = Category(**category_data.model_dump())
     session.add(category)
+    await session.flush()
 
+    await notify_catalog_change(session, category_event(category, "create"))
     await session.commit()
     await session.refresh(category)
 
@@ -35,20 +178,72 @@ async def update_category(
     category = stmt.scalar_one()
 
     if category:
+        await check_category_parent(session, category_id, new_data.parent_id)
+        moved = category.parent_id != new_data.parent_id
+
         for key, value in new_data.model_dump().items():
             setattr(category, key, value)
 
+        await session.flush()
+        if moved:
+            event = await category_move_event(session, category)
+        else:
+            event = category_event(category, "update")
+        await notify_catalog_change(session, event)
         await session.commit()
         await session.refresh(category)
 
     return category
 
 
+async def move_category(
+    session: AsyncSession, category_id: int, new_data: CategoryMove
+) -> Category:
+    stmt = await session.execute(select(Category).filter_by(id=category_id))
+    category = stmt.scalar_one()
+
+    await check_category_parent(session, category_id, new_data.parent_id)
+
+    # Descendants reference the category by id only, re-parenting its root
+    # moves the whole subtree in a single statement
+    category.parent_id = new_data.parent_id
+
+    await session.flush()
+    await notify_catalog_change(session, await category_move_event(session, category))
+    await session.commit()
+    await session.refresh(category)
+
+    return category
+
+
 async def delete_category(session: AsyncSession, category_id: int) -> Category:
     stmt = await session.execute(select(Category).filter_by(id=category_id))
     category = stmt.scalar_one()
 
     if category:
+        await notify_catalog_change(session, category_event(category, "delete"))
+
+        # Products are found through the association, which is complete even
+        # before the category_ids backfill
+        await session.execute(
+            update(Product)
+            .where(
+                Product.id.in_(
+                    select(product_category_association.c.product_id).where(
+                        product_category_association.c.category_id == category_id
+                    )
+                )
+            )
+            .values(category_ids=func.array_remove(Product.category_ids, category_id))
+            .execution_options(synchronize_session=False)
+        )
+        # Removed here so deleting the category does not load its products
+        # through the secondary relationship
+        await session.execute(
+            delete(product_category_association).where(
+                product_category_association.c.category_id == category_id
+            )
+        )
         await session.delete(category)
         await session.commit()
 
@@ -56,26 +251,76 @@ async def delete_category(session: AsyncSession, category_id: int) -> Category:
 
 
 async def get_categories_for_products(
-    session: AsyncSession, product_ids: List[int]
-) -> List[Category]:
-    stmt = (
-        select(Category)
-        .join(
+    session: AsyncSession,
+    product_ids: List[int],
+    fields: Sequence[str] = CATEGORY_FIELDS,
+) -> Dict[int, List[dict]]:
+    """Map every existing product of product_ids to its categories.
+
+    Rows are grouped by category, so each category is read and serialized
+    once however many products share it. Missing products are left out.
+    """
+    requested = (
+        select(func.unnest(literal(product_ids, ARRAY(Integer))).label("id"))
+        .distinct()
+        .cte("requested")
+    )
+    columns = category_columns(fields)
+
+    products = requested.outerjoin(Product, Product.id == requested.c.id)
+    if await backfill_completed(session, CATEGORY_IDS):
+        products = products.outerjoin(Category, Category.id == any_(Product.category_ids))
+    else:
+        products = products.outerjoin(
             product_category_association,
-            Category.id == product_category_association.c.category_id,
+            product_category_association.c.product_id == Product.id,
+        ).outerjoin(Category, Category.id == product_category_association.c.category_id)
+
+    stmt = (
+        select(
+            *columns,
+            func.array_agg(requested.c.id).label("product_ids"),
+            func.array_agg(requested.c.id)
+            .filter(Product.id.is_(None))
+            .label("missing_product_ids"),
         )
-        .where(product_category_association.c.product_id.in_(product_ids))
-        .distinct()
+        .select_from(products)
+        .group_by(*columns)
     )
 
-    db_category = await session.execute(stmt)
-    categories = db_category.scalars().all()
-    return categories
+    result = await session.execute(stmt)
+
+    product_categories = {}
+    for row in result:
+        if row.id is None:
+            # Products without categories share this group with missing ones
+            missing_product_ids = set(row.missing_product_ids or ())
+            for product_id in row.product_ids:
+                if product_id not in missing_product_ids:
+                    product_categories.setdefault(product_id, [])
+            continue
+
+        category = category_row(row, fields)
+        for product_id in row.product_ids:
+            product_categories.setdefault(product_id, []).append(category)
+
+    return product_categories
 
 
 async def get_categories_with_product_count(
-    session: AsyncSession, category_ids: List[int]
+    session: AsyncSession,
+    category_ids: List[int],
+    fields: Sequence[str] = CATEGORY_COUNT_FIELDS,
 ):
+    if "products_count" not in fields:
+        # Nothing to count, skip the association join
+        stmt = select(
+            Category.id.label("category_id"), Category.name.label("category_name")
+        ).where(Category.id.in_(category_ids))
+        result = await session.execute(stmt)
+
+        return [category_row(row, fields) for row in result]
+
     stmt = (
         select(
             Category.id.label("category_id"),
@@ -93,11 +338,4 @@ async def get_categories_with_product_count(
 
     result = await session.execute(stmt)
 
-    return [
-        {
-            "category_id": row.category_id,
-            "category_name": row.category_name,
-            "products_count": row.products_count,
-        }
-        for row in result
-    ]
+    return [category_row(row, fields) for row in result]
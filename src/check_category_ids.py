@@ -0,0 +1,116 @@
+"""Check that Product.category_ids matches product_category_association.
+
+    python check_category_ids.py [--batch-size 10000] [--fix]
+
+Products are checked in id batches, --fix rewrites the arrays that disagree
+from the association, which stays the source of truth.
+"""
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import Integer, func, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from database import async_session_maker
+import models  # Registers every model so mappers can be configured
+from product.models import Product, product_category_association
+
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+
+def associated_category_ids(product_id):
+    return (
+        select(
+            func.coalesce(
+                func.array_agg(product_category_association.c.category_id),
+                literal([], ARRAY(Integer)),
+            )
+        )
+        .where(product_category_association.c.product_id == product_id)
+        .scalar_subquery()
+    )
+
+
+def checked_products(after: int, batch_size: int):
+    batch = (
+        select(Product.id, Product.category_ids)
+        .where(Product.id > after)
+        .order_by(Product.id)
+        .limit(batch_size)
+        .subquery()
+    )
+    associated = (
+        select(
+            product_category_association.c.product_id,
+            func.array_agg(product_category_association.c.category_id).label("ids"),
+        )
+        .where(product_category_association.c.product_id.in_(select(batch.c.id)))
+        .group_by(product_category_association.c.product_id)
+        .subquery()
+    )
+    associated_ids = func.coalesce(associated.c.ids, literal([], ARRAY(Integer)))
+
+    # Compared as sets, the array keeps the order the client sent
+    return (
+        select(
+            batch.c.id,
+            associated_ids.label("associated_ids"),
+            (
+                batch.c.category_ids.contains(associated_ids)
+                & batch.c.category_ids.contained_by(associated_ids)
+            ).label("consistent"),
+        )
+        .select_from(
+            batch.outerjoin(associated, associated.c.product_id == batch.c.id)
+        )
+        .order_by(batch.c.id)
+    )
+
+
+async def check(batch_size: int, fix: bool) -> int:
+    inconsistent = 0
+    after = 0
+
+    while True:
+        async with async_session_maker() as session:
+            rows = (await session.execute(checked_products(after, batch_size))).all()
+            if not rows:
+                break
+
+            for row in rows:
+                if row.consistent:
+                    continue
+
+                inconsistent += 1
+                print(f"Product {row.id}: association has {row.associated_ids}")
+
+                if fix:
+                    # Re-read in the UPDATE, the association may have changed
+                    await session.execute(
+                        update(Product)
+                        .where(Product.id == row.id)
+                        .values(category_ids=associated_category_ids(Product.id))
+                    )
+
+            await session.commit()
+            after = rows[-1].id
+
+    print(f"Inconsistent products: {inconsistent}")
+    return inconsistent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--fix", action="store_true")
+    args = parser.parse_args()
+
+    inconsistent = asyncio.run(check(args.batch_size, args.fix))
+    sys.exit(1 if inconsistent and not args.fix else 0)
+
+
+if __name__ == "__main__":
+    main()
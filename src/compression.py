@@ -0,0 +1,254 @@
+import hashlib
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Bodies larger than this are compressed in a worker thread so a several MB
+# category tree does not block the event loop
+THREAD_COMPRESSION_SIZE = 256 * 1024
+
+# Never compressed: already encoded or must reach the client unbuffered
+SKIPPED_CONTENT_TYPES = ("text/event-stream",)
+
+
+class GzipStream:
+    max_level = 9
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        # Sync flush so every chunk of a stream can be decoded on arrival
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliStream:
+    max_level = 11
+
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdStream:
+    max_level = 22
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Supported encodings in server preference order
+ENCODINGS: Dict[str, Callable] = {}
+if zstandard is not None:
+    ENCODINGS["zstd"] = ZstdStream
+if brotli is not None:
+    ENCODINGS["br"] = BrotliStream
+ENCODINGS["gzip"] = GzipStream
+
+
+def select_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    # Highest client quality wins, server preference only breaks ties
+    selected, selected_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > selected_quality:
+            selected, selected_quality = encoding, quality
+
+    return selected
+
+
+def compress(encoding: str, level: int, body: bytes) -> bytes:
+    stream = ENCODINGS[encoding](level)
+    return stream.compress(body) + stream.finish()
+
+
+class CompressedBodyCache:
+    """LRU of compressed bodies keyed by encoding and a digest of the body.
+
+    Hot endpoints keep returning byte-identical payloads, hashing them is far
+    cheaper than compressing them again.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self._entries: "OrderedDict[Tuple[str, bytes], bytes]" = OrderedDict()
+
+    @staticmethod
+    def key(encoding: str, body: bytes) -> Tuple[str, bytes]:
+        return encoding, hashlib.blake2b(body, digest_size=16).digest()
+
+    def get(self, key: Tuple[str, bytes]) -> Optional[bytes]:
+        compressed = self._entries.get(key)
+        if compressed is not None:
+            self._entries.move_to_end(key)
+        return compressed
+
+    def put(self, key: Tuple[str, bytes], compressed: bytes) -> None:
+        if len(compressed) > self.max_size or key in self._entries:
+            return
+
+        self._entries[key] = compressed
+        self.size += len(compressed)
+        while self.size > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class CompressionMiddleware:
+    def __init__(
+        self, app: ASGIApp, minimum_size: int, level: int, cache_size: int
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+        self.cache = CompressedBodyCache(cache_size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.level = min(middleware.level, ENCODINGS[encoding].max_level)
+        self.downstream = send
+        self.start_message: Optional[Message] = None
+        self.stream = None
+        self.passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            content_length = headers.get("content-length")
+
+            self.passthrough = (
+                "content-encoding" in headers
+                or content_type.startswith(SKIPPED_CONTENT_TYPES)
+                or (
+                    content_length is not None
+                    and int(content_length) < self.middleware.minimum_size
+                )
+            )
+
+            if self.passthrough:
+                await self.downstream(message)
+            else:
+                # Headers depend on the first body chunk, hold them until then
+                self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start_message, self.start_message = self.start_message, None
+
+            if not more_body:
+                await self.send_whole_body(start_message, body)
+                return
+
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            del headers["Content-Length"]
+            await self.downstream(start_message)
+
+            self.stream = ENCODINGS[self.encoding](self.level)
+
+        chunk = self.stream.compress(body)
+        if not more_body:
+            chunk += self.stream.finish()
+
+        await self.downstream(
+            {"type": "http.response.body", "body": chunk, "more_body": more_body}
+        )
+
+    async def send_whole_body(self, start_message: Message, body: bytes) -> None:
+        headers = MutableHeaders(raw=start_message["headers"])
+        headers.add_vary_header("Accept-Encoding")
+
+        if len(body) < self.middleware.minimum_size:
+            await self.downstream(start_message)
+            await self.downstream({"type": "http.response.body", "body": body})
+            return
+
+        cache = self.middleware.cache
+        key = cache.key(self.encoding, body)
+        compressed = cache.get(key)
+
+        if compressed is None:
+            if len(body) > THREAD_COMPRESSION_SIZE:
+                compressed = await anyio.to_thread.run_sync(
+                    compress, self.encoding, self.level, body
+                )
+            else:
+                compressed = compress(self.encoding, self.level, body)
+            cache.put(key, compressed)
+
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+
+        await self.downstream(start_message)
+        await self.downstream({"type": "http.response.body", "body": compressed})
@@ -7,4 +7,39 @@ DB_HOST = os.environ.get("DB_HOST")
 DB_PORT = os.environ.get("DB_PORT")
 DB_NAME = os.environ.get("DB_NAME")
 DB_USER = os.environ.get("DB_USER")
-DB_PASS = os.environ.get("DB_PASS")
\ No newline at end of file
+DB_PASS = os.environ.get("DB_PASS")
+
+# Postgres LISTEN/NOTIFY channel used to push catalog changes to clients
+EVENTS_CHANNEL = os.environ.get("EVENTS_CHANNEL", "catalog_changes")
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", 256))
+EVENTS_HELD_SIZE = int(os.environ.get("EVENTS_HELD_SIZE", 10000))
+EVENTS_HEARTBEAT_INTERVAL = float(os.environ.get("EVENTS_HEARTBEAT_INTERVAL", 15))
+EVENTS_RECONNECT_INTERVAL = float(os.environ.get("EVENTS_RECONNECT_INTERVAL", 5))
+
+# Response compression, the level is capped at each codec's maximum
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MINIMUM_SIZE", 1024))
+COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL", 5))
+COMPRESSION_CACHE_SIZE = int(os.environ.get("COMPRESSION_CACHE_SIZE", 64 * 1024 * 1024))
+
+# Seconds between checks whether a pending column backfill has completed
+BACKFILL_RECHECK_INTERVAL = float(os.environ.get("BACKFILL_RECHECK_INTERVAL", 30))
+
+# Rows fetched per round trip when large results are streamed from Postgres
+READ_BATCH_SIZE = int(os.environ.get("READ_BATCH_SIZE", 10000))
+
+# Statement timeouts of the read routes in milliseconds, 0 disables them
+STATEMENT_TIMEOUT = int(os.environ.get("STATEMENT_TIMEOUT", 10000))
+COUNT_STATEMENT_TIMEOUT = int(os.environ.get("COUNT_STATEMENT_TIMEOUT", 5000))
+TREE_STATEMENT_TIMEOUT = int(os.environ.get("TREE_STATEMENT_TIMEOUT", 30000))
+# Seconds between checks whether the client of a running query went away
+DISCONNECT_POLL_INTERVAL = float(os.environ.get("DISCONNECT_POLL_INTERVAL", 0.5))
+# Most ids accepted by a single request
+MAX_IDS_PER_REQUEST = int(os.environ.get("MAX_IDS_PER_REQUEST", 1000))
+# Largest limit= of listings, top-N reads up to this many rows per category
+MAX_PRODUCTS_LIMIT = int(os.environ.get("MAX_PRODUCTS_LIMIT", 1000))
+
+# Partitioning of product and product_category_association, read by migrations
+PRODUCT_PARTITIONS = int(os.environ.get("PRODUCT_PARTITIONS", 16))
+# "hash" on product_id like product, or "range" on category_id
+ASSOCIATION_PARTITIONING = os.environ.get("ASSOCIATION_PARTITIONING", "hash")
+ASSOCIATION_CATEGORY_RANGE = int(os.environ.get("ASSOCIATION_CATEGORY_RANGE", 10000))
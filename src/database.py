@@ -1,6 +1,8 @@
-from typing import AsyncGenerator
+from functools import lru_cache
+from typing import AsyncGenerator, Callable, Iterable
 
-from sqlalchemy import MetaData
+from sqlalchemy import Integer, MetaData, any_, event, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import DeclarativeMeta, declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -18,3 +20,30 @@ async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
+
+
+@lru_cache(maxsize=None)
+def get_session_with_timeout(
+    timeout: int,
+) -> Callable[[], AsyncGenerator[AsyncSession, None]]:
+    # Session dependency whose statements Postgres cancels after `timeout` ms.
+    # One function per timeout, so app.dependency_overrides can replace it
+    async def get_session() -> AsyncGenerator[AsyncSession, None]:
+        async with async_session_maker() as session:
+
+            # Runs lazily with the first statement of every transaction. SET
+            # LOCAL, the pooled connection gets its default back afterwards
+            @event.listens_for(session.sync_session, "after_begin")
+            def set_statement_timeout(_session, _transaction, connection):
+                connection.execute(
+                    select(func.set_config("statement_timeout", str(timeout), True))
+                )
+
+            yield session
+
+    return get_session
+
+
+def any_id(ids: Iterable[int]):
+    # Binds the ids as a single INTEGER[] parameter for "= ANY(...)"
+    return any_(literal(list(ids), ARRAY(Integer)))
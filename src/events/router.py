@@ -0,0 +1,141 @@
+import asyncio
+import json
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import List
+
+from fastapi import APIRouter, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from config import EVENTS_HEARTBEAT_INTERVAL, MAX_IDS_PER_REQUEST
+from database import async_session_maker
+
+from category.utils import get_category_subtree_ids
+from events.utils import OVERFLOW_EVENT, broker
+
+from exceptions import basic_exception
+
+
+router = APIRouter()
+
+
+async def resolve_category_subtree(category_ids: List[int]) -> List[int]:
+    if not category_ids:
+        return []
+
+    # Short-lived session, a long-lived stream must not hold a pooled connection
+    async with async_session_maker() as session:
+        subtree_ids = await get_category_subtree_ids(
+            session=session, category_ids=category_ids
+        )
+
+    if not set(category_ids).issubset(subtree_ids):
+        raise LookupError
+
+    return subtree_ids
+
+
+@asynccontextmanager
+async def subscribe(product_ids: List[int], category_ids: List[int]):
+    # Registered before the subtree is read and held until it is known, a
+    # category created or moved in between is still followed
+    async with broker.subscribe(
+        product_ids, category_ids, held=bool(category_ids)
+    ) as subscription:
+        subscription.follow(await resolve_category_subtree(category_ids))
+        yield subscription
+
+
+@router.get("/stream")
+async def catalog_events_stream(
+    request: Request,
+    product_ids: List[int] = Query([], max_length=MAX_IDS_PER_REQUEST),
+    category_ids: List[int] = Query([], max_length=MAX_IDS_PER_REQUEST),
+):
+    if not product_ids and not category_ids:
+        await basic_exception(
+            status_code=400, message="Subscribe to at least one product or category"
+        )
+
+    # Subscribed before the response starts so a missing category is a 404.
+    # Starlette runs the background task after the stream ends or the client
+    # disconnects, even when the stream never started
+    subscriptions = AsyncExitStack()
+    try:
+        subscription = await subscriptions.enter_async_context(
+            subscribe(product_ids, category_ids)
+        )
+    except LookupError:
+        await basic_exception(status_code=404, message="One or more category not found")
+
+    async def event_stream():
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(), timeout=EVENTS_HEARTBEAT_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+
+            yield f"event: {event['entity']}\ndata: {json.dumps(event)}\n\n"
+
+            if event is OVERFLOW_EVENT:
+                break
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(subscriptions.aclose),
+    )
+
+
+@router.websocket("/ws")
+async def catalog_events_ws(
+    websocket: WebSocket,
+    product_ids: List[int] = Query([], max_length=MAX_IDS_PER_REQUEST),
+    category_ids: List[int] = Query([], max_length=MAX_IDS_PER_REQUEST),
+):
+    if not product_ids and not category_ids:
+        await websocket.close(code=1008, reason="Nothing to subscribe to")
+        return
+
+    async with AsyncExitStack() as subscriptions:
+        try:
+            subscription = await subscriptions.enter_async_context(
+                subscribe(product_ids, category_ids)
+            )
+        except LookupError:
+            await websocket.close(code=1008, reason="One or more category not found")
+            return
+
+        await websocket.accept()
+
+        # Clients are not expected to send anything, reading only detects disconnects
+        receiver = asyncio.ensure_future(websocket.receive())
+        getter = asyncio.ensure_future(subscription.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {receiver, getter}, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if receiver in done:
+                    if receiver.result()["type"] == "websocket.disconnect":
+                        break
+                    receiver = asyncio.ensure_future(websocket.receive())
+
+                if getter in done:
+                    event = getter.result()
+                    await websocket.send_json(event)
+
+                    if event is OVERFLOW_EVENT:
+                        await websocket.close(code=1013, reason="Consumer too slow")
+                        break
+                    getter = asyncio.ensure_future(subscription.get())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receiver.cancel()
+            getter.cancel()
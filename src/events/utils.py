@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import Iterable, List, Optional
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import (
+    EVENTS_CHANNEL,
+    EVENTS_HELD_SIZE,
+    EVENTS_QUEUE_SIZE,
+    EVENTS_RECONNECT_INTERVAL,
+)
+from database import DATABASE_URL
+
+
+logger = logging.getLogger(__name__)
+
+# asyncpg expects a plain postgres DSN without the SQLAlchemy driver suffix
+LISTEN_DSN = DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+# Sent to a subscriber instead of the events it missed, the client has to
+# re-read the data it is interested in
+OVERFLOW_EVENT = {"entity": "overflow", "action": "resync", "id": None}
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_PAYLOAD_LIMIT = 8000
+
+# Most ids an event lists, any 32-bit id with its separator fits in 16 bytes
+MAX_EVENT_IDS = NOTIFY_PAYLOAD_LIMIT // 16
+
+
+def catalog_change_payload(event: dict) -> str:
+    payload = json.dumps(event, separators=(",", ":"))
+    if len(payload.encode()) >= NOTIFY_PAYLOAD_LIMIT:
+        # Too many ids to list, every subscriber resyncs instead. Failing the
+        # write because of its notification is never an option
+        return json.dumps(OVERFLOW_EVENT)
+    return payload
+
+
+async def notify_catalog_change(session: AsyncSession, event: dict) -> None:
+    # NOTIFY is transactional, listeners receive the event only after commit
+    await session.execute(
+        select(func.pg_notify(EVENTS_CHANNEL, catalog_change_payload(event)))
+    )
+
+
+class Subscription:
+    def __init__(
+        self,
+        product_ids: Iterable[int],
+        category_ids: Iterable[int],
+        queue_size: int,
+        held: bool = False,
+    ):
+        self.product_ids = set(product_ids)
+        self.category_ids = set(category_ids)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+        # Events received before follow() knows the whole subtree, matched
+        # once it does. None when the subscription is not held
+        self.held: Optional[List[dict]] = [] if held else None
+
+    def deliver(self, event: dict) -> None:
+        if self.held is not None:
+            if len(self.held) < EVENTS_HELD_SIZE:
+                self.held.append(event)
+            else:
+                # The subtree takes too long to read, resync like a slow consumer
+                self.held = None
+                self.resync()
+            return
+
+        if self.matches(event):
+            self.offer(event)
+
+    def follow(self, category_ids: Iterable[int]) -> None:
+        self.category_ids.update(category_ids)
+
+        held, self.held = self.held or [], None
+        for event in held:
+            self.deliver(event)
+
+    def matches(self, event: dict) -> bool:
+        if event["entity"] == "overflow":
+            return True
+
+        if event["entity"] == "product":
+            return event["id"] in self.product_ids or not self.category_ids.isdisjoint(
+                event.get("category_ids") or ()
+            )
+
+        if event["entity"] == "category":
+            subtree_ids = event.get("subtree_ids")
+            if subtree_ids is not None:
+                return self.match_move(event["parent_id"], subtree_ids)
+
+            # Follow categories created inside the subscribed subtree
+            if event["action"] != "delete" and event.get("parent_id") in self.category_ids:
+                self.category_ids.add(event["id"])
+
+            return event["id"] in self.category_ids
+
+        return False
+
+    def match_move(self, parent_id: Optional[int], subtree_ids: List[int]) -> bool:
+        if parent_id in self.category_ids:
+            # Moved into (or within) the subscribed subtree, follow all of it
+            self.category_ids.update(subtree_ids)
+            return True
+
+        if not self.category_ids.isdisjoint(subtree_ids):
+            # Moved out of a subscribed subtree, or a subscribed category moved
+            # elsewhere. Only the subscriber knows its roots, it resubscribes
+            self.resync()
+
+        return False
+
+    def offer(self, event: dict) -> None:
+        if self.overflowed:
+            return
+
+        if event["entity"] == "overflow":
+            self.resync()
+            return
+
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow consumer: tell it to resync instead of buffering without limit
+            self.resync()
+
+    def resync(self) -> None:
+        if self.overflowed:
+            return
+
+        # Drop everything not read yet, OVERFLOW_EVENT is the last event
+        self.overflowed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(OVERFLOW_EVENT)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+
+class CatalogEventBroker:
+    """Fans out NOTIFY payloads from one LISTEN connection per process."""
+
+    def __init__(self, channel: str, queue_size: int):
+        self.channel = channel
+        self.queue_size = queue_size
+        self._subscriptions = set()
+        self._connection: Optional[asyncpg.Connection] = None
+        self._lock = asyncio.Lock()
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def start(self) -> None:
+        async with self._lock:
+            if self._connection is not None and not self._connection.is_closed():
+                return
+
+            self._closed = False
+            connection = await asyncpg.connect(LISTEN_DSN)
+            connection.add_termination_listener(self._on_termination)
+            await connection.add_listener(self.channel, self._on_notify)
+            self._connection = connection
+
+    async def stop(self) -> None:
+        self._closed = True
+
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+
+        async with self._lock:
+            if self._connection is not None and not self._connection.is_closed():
+                await self._connection.close()
+            self._connection = None
+
+    def publish(self, event: dict) -> None:
+        for subscription in list(self._subscriptions):
+            subscription.deliver(event)
+
+    @asynccontextmanager
+    async def subscribe(
+        self, product_ids: Iterable[int], category_ids: Iterable[int], held: bool = False
+    ):
+        await self.start()
+
+        subscription = Subscription(product_ids, category_ids, self.queue_size, held)
+        self._subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscriptions.discard(subscription)
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("Skipping malformed catalog event: %r", payload)
+            return
+
+        self.publish(event)
+
+    def _on_termination(self, connection) -> None:
+        if self._closed:
+            return
+
+        # Events sent while we were disconnected are lost
+        for subscription in list(self._subscriptions):
+            subscription.resync()
+
+        self._connection = None
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        while not self._closed:
+            try:
+                await self.start()
+                return
+            except (OSError, asyncpg.PostgresError):
+                logger.warning("Catalog events listener reconnect failed, retrying")
+                await asyncio.sleep(EVENTS_RECONNECT_INTERVAL)
+
+
+broker = CatalogEventBroker(EVENTS_CHANNEL, EVENTS_QUEUE_SIZE)
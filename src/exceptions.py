@@ -1,6 +1,22 @@
 from fastapi import HTTPException
 
 
+class CategoryCycleError(Exception):
+    """Raised when a category would become its own ancestor."""
+
+
+class InvalidFieldsError(Exception):
+    """Raised when a fields= query parameter names an unknown field."""
+
+
+class StatementTimeoutError(Exception):
+    """Raised when Postgres cancelled a query at its statement_timeout."""
+
+
+class ClientDisconnectedError(Exception):
+    """Raised when the client went away before its query finished."""
+
+
 async def basic_exception(
     status_code: int = 500,
     message: str = "Server error, try later",
@@ -0,0 +1,20 @@
+from typing import List, Optional, Sequence
+
+from exceptions import InvalidFieldsError
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> List[str]:
+    """Turn a "fields=id,price" query value into an ordered list of fields.
+
+    No value means every allowed field, unknown names raise InvalidFieldsError.
+    """
+    if not fields:
+        return list(allowed)
+
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+
+    unknown = requested.difference(allowed)
+    if unknown or not requested:
+        raise InvalidFieldsError(sorted(unknown))
+
+    return [field for field in allowed if field in requested]
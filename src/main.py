@@ -1,6 +1,10 @@
 from fastapi import FastAPI
 
+from compression import CompressionMiddleware
+from config import COMPRESSION_CACHE_SIZE, COMPRESSION_LEVEL, COMPRESSION_MINIMUM_SIZE
 from category.router import router as category_router
+from events.router import router as events_router
+from events.utils import broker
 from product.router import router as product_router
 
 
@@ -8,6 +12,13 @@ app = FastAPI(
     title="simple_shop"
 )
 
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MINIMUM_SIZE,
+    level=COMPRESSION_LEVEL,
+    cache_size=COMPRESSION_CACHE_SIZE,
+)
+
 app.include_router(
     category_router,
     prefix="/api/v1.0/categories",
@@ -18,4 +29,15 @@ app.include_router(
     product_router,
     prefix="/api/v1.0/products",
     tags=["Products"]
-)
\ No newline at end of file
+)
+
+app.include_router(
+    events_router,
+    prefix="/api/v1.0/events",
+    tags=["Events"]
+)
+
+
+@app.on_event("shutdown")
+async def stop_catalog_events():
+    await broker.stop()
@@ -1,5 +1,6 @@
 from product.models import *
 from category.models import *
+from backfills import column_backfill
 
 
 # Empty function used by Alembic to discover database tables
@@ -0,0 +1,130 @@
+"""Online copy of product tables into their partitioned replacements.
+
+Between migrations 5b1d7c3a9f20 and 8e4a2f6c1d93:
+
+    python partition_tables.py backfill --batch-size 10000 --pause 0.1
+    python partition_tables.py verify
+    cd .. && alembic upgrade 8e4a2f6c1d93
+
+The backfill records its progress and resumes where it stopped. Partition
+pruning of the util queries is covered by tests/test_partition_pruning.py.
+"""
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import text
+
+from database import engine
+
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+
+BATCH_UPPER_BOUND = text("""
+    SELECT max(id) FROM (
+        SELECT id FROM product WHERE id > :after ORDER BY id LIMIT :batch_size
+    ) AS batch
+""")
+
+# FOR SHARE holds off concurrent updates and deletes of the copied rows until
+# the batch commits, so the sync triggers always run after the copy
+COPY_PRODUCTS = text("""
+    INSERT INTO product_partitioned (id, name, price)
+    SELECT id, name, price FROM product
+    WHERE id > :after AND id <= :upper
+    FOR SHARE
+    ON CONFLICT (id) DO NOTHING
+""")
+
+COPY_ASSOCIATIONS = text("""
+    INSERT INTO product_category_association_partitioned (product_id, category_id)
+    SELECT product_id, category_id FROM product_category_association
+    WHERE product_id > :after AND product_id <= :upper AND category_id IS NOT NULL
+    FOR SHARE
+    ON CONFLICT DO NOTHING
+""")
+
+ASSOCIATION_PRODUCT_INDEX = text("""
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_product_category_association_product_id
+    ON product_category_association (product_id)
+""")
+
+BACKFILL_PROGRESS = text("SELECT copied_up_to FROM product_partition_backfill")
+
+SAVE_PROGRESS = text("UPDATE product_partition_backfill SET copied_up_to = :upper")
+
+MISSING_ROWS = text("""
+    SELECT
+        (SELECT count(*) FROM product WHERE NOT EXISTS (
+            SELECT 1 FROM product_partitioned AS p WHERE p.id = product.id
+        )) AS products,
+        (SELECT count(*) FROM product_category_association AS a
+         WHERE a.product_id IS NOT NULL AND a.category_id IS NOT NULL
+         AND NOT EXISTS (
+            SELECT 1 FROM product_category_association_partitioned AS p
+            WHERE p.product_id = a.product_id AND p.category_id = a.category_id
+        )) AS associations
+""")
+
+
+async def backfill(batch_size: int, pause: float):
+    # Without it every batch would scan the whole association table
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(ASSOCIATION_PRODUCT_INDEX)
+
+    async with engine.connect() as connection:
+        after = await connection.scalar(BACKFILL_PROGRESS)
+
+    while True:
+        # One short transaction per batch keeps row locks brief
+        async with engine.begin() as connection:
+            upper = await connection.scalar(
+                BATCH_UPPER_BOUND, {"after": after, "batch_size": batch_size}
+            )
+            if upper is None:
+                break
+
+            await connection.execute(COPY_PRODUCTS, {"after": after, "upper": upper})
+            await connection.execute(
+                COPY_ASSOCIATIONS, {"after": after, "upper": upper}
+            )
+            await connection.execute(SAVE_PROGRESS, {"upper": upper})
+
+        print(f"Copied products up to id {upper}")
+        after = upper
+        await asyncio.sleep(pause)
+
+
+async def verify() -> bool:
+    async with engine.connect() as connection:
+        missing = (await connection.execute(MISSING_ROWS)).one()
+
+    print(f"Missing products: {missing.products}")
+    print(f"Missing associations: {missing.associations}")
+    return not missing.products and not missing.associations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_parser = subparsers.add_parser("backfill")
+    backfill_parser.add_argument("--batch-size", type=int, default=10000)
+    backfill_parser.add_argument(
+        "--pause", type=float, default=0.1, help="seconds to sleep between batches"
+    )
+    subparsers.add_parser("verify")
+
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        asyncio.run(backfill(args.batch_size, args.pause))
+    else:
+        sys.exit(0 if asyncio.run(verify()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,25 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Float, Table
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Float, Table
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
+from config import ASSOCIATION_PARTITIONING
 from database import Base
 
 
 class Product(Base):
     __tablename__ = "product"
+    __table_args__ = (
+        Index("ix_product_category_ids", "category_ids", postgresql_using="gin"),
+        {"postgresql_partition_by": "HASH (id)"},
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     price = Column(Float, nullable=False)
+    # Copy of the product's rows in product_category_association, written in
+    # the same transaction, so reads need no join
+    category_ids = Column(
+        ARRAY(Integer), nullable=False, default=list, server_default="{}"
+    )
 
     categories = relationship(
         "Category", secondary="product_category_association", back_populates="products"
@@ -18,6 +29,20 @@ class Product(Base):
 product_category_association = Table(
     "product_category_association",
     Base.metadata,
-    Column("product_id", Integer, ForeignKey("product.id")),
-    Column("category_id", Integer, ForeignKey("category.id")),
+    Column("product_id", Integer, ForeignKey("product.id"), primary_key=True),
+    Column("category_id", Integer, ForeignKey("category.id"), primary_key=True),
+    # Copy of Product.price so top-N listings are served by the index below
+    Column("price", Float, nullable=False),
+    Index("ix_product_category_association_category_id", "category_id", "product_id"),
+    Index(
+        "ix_product_category_association_category_price",
+        "category_id",
+        "price",
+        "product_id",
+    ),
+    postgresql_partition_by=(
+        "RANGE (category_id)"
+        if ASSOCIATION_PARTITIONING == "range"
+        else "HASH (product_id)"
+    ),
 )
@@ -1,25 +1,61 @@
-from typing import List
-from fastapi import APIRouter, Depends, Query
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError, NoResultFound
 
-from database import get_async_session
-
-from product.schemas import ProductCreate, ProductRead, ProductUpdate
+from cancellation import run_until_disconnected
+from config import (
+    COUNT_STATEMENT_TIMEOUT,
+    MAX_IDS_PER_REQUEST,
+    MAX_PRODUCTS_LIMIT,
+    STATEMENT_TIMEOUT,
+    TREE_STATEMENT_TIMEOUT,
+)
+from database import get_async_session, get_session_with_timeout
+
+from product.schemas import (
+    PRODUCT_FIELDS,
+    ProductCreate,
+    ProductRead,
+    ProductRows,
+    ProductUpdate,
+)
 from product.utils import (
     create_product,
     delete_product,
     update_product,
+    get_products_by_ids,
     get_products_by_category,
     get_unique_products_count,
 )
 
-from exceptions import basic_exception
+from exceptions import (
+    ClientDisconnectedError,
+    InvalidFieldsError,
+    StatementTimeoutError,
+    basic_exception,
+)
+from fields import parse_fields
 
 
 router = APIRouter()
 
 
+def rows_response(rows: ProductRows) -> Response:
+    # Serialized straight from the column arrays, skipping jsonable_encoder
+    return Response(
+        content=b"".join(
+            (
+                b'{"status":"success","data":',
+                *rows.json_chunks(),
+                b',"detail":null}',
+            )
+        ),
+        media_type="application/json",
+    )
+
+
 @router.post("", response_model=dict)
 async def product_create(
     product: ProductCreate, session: AsyncSession = Depends(get_async_session)
@@ -93,26 +129,86 @@ async def product_delete(
         await basic_exception(status_code=500, message="Error while creating product")
 
 
+@router.get("", response_model=dict)
+async def products_by_ids(
+    request: Request,
+    ids: List[int] = Query(max_length=MAX_IDS_PER_REQUEST),
+    fields: Optional[str] = None,
+    session: AsyncSession = Depends(get_session_with_timeout(STATEMENT_TIMEOUT)),
+):
+    try:
+        products = await run_until_disconnected(
+            request,
+            get_products_by_ids(
+                session=session,
+                product_ids=ids,
+                fields=parse_fields(fields, PRODUCT_FIELDS),
+            ),
+        )
+
+        if len(products) != len(set(ids)):
+            raise NoResultFound
+
+        return {"status": "success", "data": products, "detail": None}
+    except InvalidFieldsError:
+        await basic_exception(status_code=400, message="Unknown field requested")
+    except NoResultFound:
+        await session.rollback()
+        await basic_exception(status_code=404, message="One or more product not found")
+    except StatementTimeoutError:
+        await session.rollback()
+        await basic_exception(
+            status_code=504, message="Query took too long, request fewer ids"
+        )
+    except ClientDisconnectedError:
+        await session.rollback()
+        await basic_exception(status_code=499, message="Client closed request")
+    except Exception:
+        await session.rollback()
+        await basic_exception(status_code=500, message="Error while getting products")
+
+
 @router.get("/by_category_tree", response_model=dict)
 async def get_products_by_category_tree(
-    parent_category_id: int, session: AsyncSession = Depends(get_async_session)
+    request: Request,
+    parent_category_id: int,
+    fields: Optional[str] = None,
+    sort: Optional[Literal["price", "-price", "name"]] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PRODUCTS_LIMIT),
+    session: AsyncSession = Depends(get_session_with_timeout(TREE_STATEMENT_TIMEOUT)),
 ):
     try:
-        products = await get_products_by_category(
-            session=session, category_id=parent_category_id
+        products = await run_until_disconnected(
+            request,
+            get_products_by_category(
+                session=session,
+                category_id=parent_category_id,
+                fields=parse_fields(fields, PRODUCT_FIELDS),
+                sort=sort,
+                limit=limit,
+                compact=True,
+            ),
         )
 
         if not products:
             raise NoResultFound
 
-        return {
-            "status": "success",
-            "data": [ProductRead.model_validate(product) for product in products],
-            "detail": None,
-        }
+        # Off the event loop, a large subtree takes a while to serialize
+        return await run_in_threadpool(rows_response, products)
+    except InvalidFieldsError:
+        await basic_exception(status_code=400, message="Unknown field requested")
     except NoResultFound:
         await session.rollback()
         await basic_exception(status_code=404, message="Category does not exist")
+    except StatementTimeoutError:
+        await session.rollback()
+        await basic_exception(
+            status_code=504,
+            message="Query took too long, request a smaller tree or set a limit",
+        )
+    except ClientDisconnectedError:
+        await session.rollback()
+        await basic_exception(status_code=499, message="Client closed request")
     except Exception:
         await session.rollback()
         await basic_exception(status_code=500, message="Error while getting products")
@@ -120,12 +216,14 @@ async def get_products_by_category_tree(
 
 @router.get("/number_of_unique_by_categories_ids")
 async def get_number_of_unique_producrs(
-    category_ids: List[int] = Query(),
-    session: AsyncSession = Depends(get_async_session),
+    request: Request,
+    category_ids: List[int] = Query(max_length=MAX_IDS_PER_REQUEST),
+    session: AsyncSession = Depends(get_session_with_timeout(COUNT_STATEMENT_TIMEOUT)),
 ):
     try:
-        products_count = await get_unique_products_count(
-            session=session, category_ids=category_ids
+        products_count = await run_until_disconnected(
+            request,
+            get_unique_products_count(session=session, category_ids=category_ids),
         )
 
         if products_count is None:
@@ -141,6 +239,14 @@ async def get_number_of_unique_producrs(
         await basic_exception(
             status_code=404, message="One or more category does not exist"
         )
+    except StatementTimeoutError:
+        await session.rollback()
+        await basic_exception(
+            status_code=504, message="Query took too long, request fewer ids"
+        )
+    except ClientDisconnectedError:
+        await session.rollback()
+        await basic_exception(status_code=499, message="Client closed request")
     except Exception:
         await session.rollback()
         await basic_exception(status_code=500, message="Error while getting products")
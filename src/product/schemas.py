@@ -1,7 +1,14 @@
-from typing import List, Optional
+from array import array
+from typing import Iterator, List, Optional, Sequence
+
+import orjson
 from pydantic import BaseModel
 
 
+# Fields that can be requested through the fields= query parameter
+PRODUCT_FIELDS = ("id", "name", "price", "category_ids")
+
+
 class ProductBase(BaseModel):
     name: str
     price: float
@@ -23,3 +30,72 @@ class ProductUpdate(ProductBase):
     name: Optional[str]
     price: Optional[float]
     category_ids: Optional[List[int]] = None
+
+
+class ProductRows:
+    """Column oriented products for large read results.
+
+    Holds one typed array per field instead of an object per product, the
+    category ids of all rows are flattened into a single array with offsets.
+    """
+
+    __slots__ = (
+        "fields",
+        "ids",
+        "names",
+        "prices",
+        "category_offsets",
+        "category_values",
+    )
+
+    def __init__(self, fields: Sequence[str] = PRODUCT_FIELDS):
+        self.fields = tuple(fields)
+        self.ids = array("q")
+        self.names: List[str] = []
+        self.prices = array("d")
+        self.category_offsets = array("q", [0])
+        self.category_values = array("q")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[dict]:
+        for index in range(len(self)):
+            yield self.row(index)
+
+    def extend(self, rows) -> None:
+        # Rows are selected with product_columns(fields), id always included
+        fields = self.fields
+        for row in rows:
+            self.ids.append(row.id)
+            if "name" in fields:
+                self.names.append(row.name)
+            if "price" in fields:
+                self.prices.append(row.price)
+            if "category_ids" in fields:
+                self.category_values.extend(row.category_ids)
+                self.category_offsets.append(len(self.category_values))
+
+    def row(self, index: int) -> dict:
+        values = {}
+        for field in self.fields:
+            if field == "id":
+                values["id"] = self.ids[index]
+            elif field == "name":
+                values["name"] = self.names[index]
+            elif field == "price":
+                values["price"] = self.prices[index]
+            else:
+                start, stop = self.category_offsets[index : index + 2]
+                values["category_ids"] = self.category_values[start:stop].tolist()
+        return values
+
+    def json_chunks(self, chunk_size: int = 10000) -> Iterator[bytes]:
+        # A JSON array in pieces, only chunk_size dicts exist at any time
+        yield b"["
+        for start in range(0, len(self), chunk_size):
+            if start:
+                yield b","
+            stop = min(start + chunk_size, len(self))
+            yield orjson.dumps([self.row(index) for index in range(start, stop)])[1:-1]
+        yield b"]"
@@ -1,30 +1,76 @@
-from collections import defaultdict
-from typing import List, Optional
-from sqlalchemy import distinct, or_, select, func
-from sqlalchemy.orm import joinedload, aliased
+import heapq
+from typing import List, Optional, Sequence, Union
+from sqlalchemy import Integer, distinct, literal, select, func, true
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from backfills import ASSOCIATION_PRICE, CATEGORY_IDS, backfill_completed
 from category.models import Category
+from category.utils import category_subtree
+
+from config import READ_BATCH_SIZE
+from database import any_id
+
+from events.utils import notify_catalog_change
 
 from .models import Product, product_category_association
-from .schemas import ProductCreate, ProductRead, ProductUpdate
+from .schemas import (
+    PRODUCT_FIELDS,
+    ProductCreate,
+    ProductRead,
+    ProductRows,
+    ProductUpdate,
+)
+
+
+def product_event(product: ProductRead, action: str, category_ids: List[int]) -> dict:
+    # Ids only, subscribers re-read what changed. Unbounded fields like the
+    # name could push the payload over the NOTIFY limit
+    return {
+        "entity": "product",
+        "action": action,
+        "id": product.id,
+        "category_ids": category_ids,
+    }
+
+
+async def add_product_categories(
+    session: AsyncSession, product_id: int, category_ids: List[int], price: float
+) -> None:
+    if category_ids:
+        await session.execute(
+            product_category_association.insert(),
+            [
+                {"product_id": product_id, "category_id": category_id, "price": price}
+                for category_id in category_ids
+            ],
+        )
+
+
+async def get_product_category_ids(session: AsyncSession, product: Product) -> List[int]:
+    if await backfill_completed(session, CATEGORY_IDS):
+        return product.category_ids
+
+    # The array of a product written before the backfill may still be empty
+    result = await session.execute(
+        select(product_category_association.c.category_id).where(
+            product_category_association.c.product_id == product.id
+        )
+    )
+    return result.scalars().all()
 
 
 async def create_product(session: AsyncSession, product: ProductCreate) -> ProductRead:
-    db_product = Product(name=product.name, price=product.price)
+    # The association and Product.category_ids are written in one transaction
+    category_ids = list(dict.fromkeys(product.category_ids or []))
+
+    db_product = Product(
+        name=product.name, price=product.price, category_ids=category_ids
+    )
     session.add(db_product)
     await session.flush()
 
-    category_ids = []
-    if product.category_ids:
-        for cat_id in product.category_ids:
-            association = product_category_association.insert().values(
-                product_id=db_product.id, category_id=cat_id
-            )
-            await session.execute(association)
-            category_ids.append(cat_id)
-
-    await session.commit()
+    await add_product_categories(session, db_product.id, category_ids, product.price)
 
     response = ProductRead(
         id=db_product.id,
@@ -32,6 +78,12 @@ async def create_product(session: AsyncSession, product: ProductCreate) -> Produ
         price=db_product.price,
         category_ids=category_ids,
     )
+
+    await notify_catalog_change(
+        session, product_event(response, "create", category_ids)
+    )
+    await session.commit()
+
     return response
 
 
@@ -45,28 +97,47 @@ async def update_product(
     db_product.name = product.name
     db_product.price = product.price
 
+    # Subscribers of the old categories have to see the product leave them
+    old_category_ids = await get_product_category_ids(session, db_product)
+    notify_category_ids = set(old_category_ids)
+
     if product.category_ids is not None:
+        category_ids = list(dict.fromkeys(product.category_ids))
+        notify_category_ids.update(category_ids)
+
         await session.execute(
             product_category_association.delete().where(
                 product_category_association.c.product_id == db_product.id
             )
         )
+        await add_product_categories(
+            session, db_product.id, category_ids, product.price
+        )
 
-        for cat_id in product.category_ids:
-            association = product_category_association.insert().values(
-                product_id=db_product.id, category_id=cat_id
-            )
-            await session.execute(association)
+        db_product.category_ids = category_ids
+    else:
+        category_ids = old_category_ids
+        await session.execute(
+            product_category_association.update()
+            .where(product_category_association.c.product_id == db_product.id)
+            .values(price=product.price)
+        )
 
-    await session.commit()
-    await session.refresh(db_product)
+    await session.flush()
 
     response = ProductRead(
         id=db_product.id,
         name=db_product.name,
         price=db_product.price,
-        category_ids=product.category_ids if product.category_ids is not None else [],
+        category_ids=category_ids,
     )
+
+    await notify_catalog_change(
+        session, product_event(response, "update", sorted(notify_category_ids))
+    )
+    await session.commit()
+    await session.refresh(db_product)
+
     return response
 
 
@@ -74,15 +145,7 @@ async def delete_product(session: AsyncSession, product_id: int) -> ProductRead:
     product_stmt = select(Product).where(Product.id == product_id)
     db_product = await session.execute(product_stmt)
     db_product = db_product.scalar_one()
-
-    categories_stmt = select(product_category_association.c.category_id).where(
-        product_category_association.c.product_id == product_id
-    )
-    category_ids_result = await session.execute(categories_stmt)
-    category_ids = [row.category_id for row in category_ids_result]
-
-    await session.delete(db_product)
-    await session.commit()
+    category_ids = await get_product_category_ids(session, db_product)
 
     response = ProductRead(
         id=db_product.id,
@@ -91,39 +154,195 @@ async def delete_product(session: AsyncSession, product_id: int) -> ProductRead:
         category_ids=category_ids,
     )
 
+    await notify_catalog_change(
+        session, product_event(response, "delete", category_ids)
+    )
+    await session.delete(db_product)
+    await session.commit()
+
     return response
 
 
-async def get_products_by_category(session: AsyncSession, category_id: int):
-    child_category = aliased(Category)
+# Product columns that can be left out of the select list
+PRODUCT_COLUMNS = {
+    "name": Product.name,
+    "price": Product.price,
+    "category_ids": Product.category_ids,
+}
+
+
+def associated_category_ids():
+    # Product.category_ids read from the association, until it is backfilled
+    return func.array(
+        select(product_category_association.c.category_id)
+        .where(product_category_association.c.product_id == Product.id)
+        .scalar_subquery()
+    ).label("category_ids")
+
+
+def product_columns(fields: Sequence[str], category_ids_backfilled: bool = True):
+    columns = PRODUCT_COLUMNS
+    if not category_ids_backfilled:
+        columns = dict(PRODUCT_COLUMNS, category_ids=associated_category_ids())
+
+    # id is always selected, rows are matched by it
+    return [Product.id] + [columns[field] for field in fields if field in columns]
+
 
-    stmt = (
-        select(Product, Category.id.label("category_id"))
-        .join(
-            product_category_association,
-            Product.id == product_category_association.c.product_id,
+def product_row(row, fields: Sequence[str]) -> dict:
+    return {field: getattr(row, field) for field in fields}
+
+
+async def get_products_by_ids(
+    session: AsyncSession,
+    product_ids: List[int],
+    fields: Sequence[str] = PRODUCT_FIELDS,
+) -> List[dict]:
+    backfilled = await backfill_completed(session, CATEGORY_IDS)
+    result = await session.execute(
+        select(*product_columns(fields, backfilled)).where(
+            Product.id == any_id(product_ids)
         )
-        .join(Category, product_category_association.c.category_id == Category.id)
-        .outerjoin(child_category, Category.id == child_category.parent_id)
-        .where((Category.id == category_id) | (child_category.id == category_id))
+    )
+
+    return [product_row(product, fields) for product in result]
+
+
+# Ordering for the sort= query parameter
+PRODUCT_SORTS = {
+    "price": (Product.price.asc(), Product.id.asc()),
+    "-price": (Product.price.desc(), Product.id.desc()),
+    "name": (Product.name.asc(), Product.id.asc()),
+}
+
+
+async def get_top_product_ids_by_price(
+    session: AsyncSession, category_id: int, limit: int, descending: bool
+) -> List[int]:
+    tree = category_subtree([category_id]).subquery("tree")
+    price = product_category_association.c.price
+    product_id = product_category_association.c.product_id
+
+    # The first `limit` rows of every category, read from the
+    # (category_id, price, product_id) index without touching product;
+    # descending order is a backward scan of the same index
+    if descending:
+        order_by = (price.desc(), product_id.desc())
+    else:
+        order_by = (price.asc(), product_id.asc())
+
+    top = (
+        select(product_id, price)
+        .where(product_category_association.c.category_id == tree.c.id)
+        .order_by(*order_by)
+        .limit(limit)
+        .lateral("top")
+    )
+    stmt = select(tree.c.id.label("category_id"), top.c.product_id, top.c.price).join(
+        top, true()
     )
 
     result = await session.execute(stmt)
 
-    # Create dict with products and their categories by defaultdict
-    product_category_map = defaultdict(list)
-    for product, category_id in result:
-        product_category_map[product].append(category_id)
+    def sort_key(row):
+        if descending:
+            return (-row.price, -row.product_id)
+        return (row.price, row.product_id)
+
+    runs = {}
+    for row in result:
+        runs.setdefault(row.category_id, []).append(row)
+
+    # k-way merge of the per-category runs, a product listed in several
+    # categories is taken once. The global top N is always within the union
+    # of the per-category top N lists.
+    product_ids = []
+    seen = set()
+    for row in heapq.merge(
+        *(sorted(run, key=sort_key) for run in runs.values()), key=sort_key
+    ):
+        if row.product_id in seen:
+            continue
+        seen.add(row.product_id)
+        product_ids.append(row.product_id)
+        if len(product_ids) == limit:
+            break
+
+    return product_ids
+
+
+async def get_products_by_category(
+    session: AsyncSession,
+    category_id: int,
+    fields: Sequence[str] = PRODUCT_FIELDS,
+    sort: Optional[str] = None,
+    limit: Optional[int] = None,
+    compact: bool = False,
+) -> Union[List[dict], ProductRows]:
+    # compact=True returns ProductRows, for results too large for a dict per row
+    backfilled = await backfill_completed(session, CATEGORY_IDS)
+    columns = product_columns(fields, backfilled)
+
+    # The association's price is NULL for rows written before its backfill,
+    # sort them on product.price below until then
+    if (
+        limit is not None
+        and sort in ("price", "-price")
+        and await backfill_completed(session, ASSOCIATION_PRICE)
+    ):
+        product_ids = await get_top_product_ids_by_price(
+            session=session,
+            category_id=category_id,
+            limit=limit,
+            descending=sort == "-price",
+        )
+        result = await session.execute(
+            select(*columns).where(Product.id == any_id(product_ids))
+        )
+        products = {product.id: product for product in result}
+        ordered = [
+            products[product_id] for product_id in product_ids if product_id in products
+        ]
+
+        if compact:
+            rows = ProductRows(fields)
+            rows.extend(ordered)
+            return rows
+
+        return [product_row(product, fields) for product in ordered]
+
+    tree = category_subtree([category_id])
+    if backfilled:
+        # Served by the GIN index on category_ids, each product comes back once
+        in_tree = Product.category_ids.overlap(func.array(tree.scalar_subquery()))
+    else:
+        # Semi-join, also returns every product once
+        in_tree = Product.id.in_(
+            select(product_category_association.c.product_id).where(
+                product_category_association.c.category_id.in_(tree)
+            )
+        )
+    stmt = select(*columns).where(in_tree)
+    if sort is not None:
+        stmt = stmt.order_by(*PRODUCT_SORTS[sort])
+    elif limit is not None:
+        stmt = stmt.order_by(Product.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    if compact:
+        # Server side cursor, only one batch of Row objects is alive at a time
+        result = await session.stream(
+            stmt.execution_options(yield_per=READ_BATCH_SIZE)
+        )
+        rows = ProductRows(fields)
+        async for partition in result.partitions():
+            rows.extend(partition)
+        return rows
+
+    result = await session.execute(stmt)
 
-    return [
-        {
-            "id": product.id,
-            "name": product.name,
-            "price": product.price,
-            "category_ids": category_ids,
-        }
-        for product, category_ids in product_category_map.items()
-    ]
+    return [product_row(product, fields) for product in result]
 
 
 async def get_unique_products_count(
@@ -137,11 +356,16 @@ async def get_unique_products_count(
     if existing_categories_count < len(category_ids):
         return None
 
-    stmt = select(distinct(product_category_association.c.product_id)).where(
-        product_category_association.c.category_id.in_(category_ids)
-    )
+    if await backfill_completed(session, CATEGORY_IDS):
+        stmt = select(func.count(Product.id)).where(
+            Product.category_ids.overlap(literal(category_ids, ARRAY(Integer)))
+        )
+    else:
+        stmt = select(
+            func.count(distinct(product_category_association.c.product_id))
+        ).where(product_category_association.c.category_id.in_(category_ids))
 
     result = await session.execute(stmt)
-    unique_products_ids = [row[0] for row in result]
 
-    return len(unique_products_ids)
+    return result.scalar()
+
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy.engine import make_url
+
+
+# config.py reads the DB_* settings at import time. Tests that need Postgres
+# take them from DATABASE_URL and skip without it, the rest never connect.
+if os.environ.get("DATABASE_URL"):
+    url = make_url(os.environ["DATABASE_URL"])
+    os.environ.update(
+        DB_HOST=url.host or "localhost",
+        DB_PORT=str(url.port or 5432),
+        DB_NAME=url.database or "",
+        DB_USER=url.username or "",
+        DB_PASS=url.password or "",
+    )
+else:
+    for name, value in (
+        ("DB_HOST", "localhost"),
+        ("DB_PORT", "5432"),
+        ("DB_NAME", "shop"),
+        ("DB_USER", "shop"),
+        ("DB_PASS", "shop"),
+    ):
+        os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+
+import backfills  # noqa: E402
+import models  # noqa: E402  Registers every model so mappers can be configured
+
+
+@pytest.fixture(autouse=True)
+def completed_backfills(monkeypatch):
+    # Reads use the backfilled columns unless a test clears this set
+    completed = {backfills.CATEGORY_IDS, backfills.ASSOCIATION_PRICE}
+    monkeypatch.setattr(backfills, "_completed", completed)
+    monkeypatch.setattr(backfills, "_checked_at", {})
+    return completed
+
+
+@pytest.fixture
+def database():
+    if not os.environ.get("DATABASE_URL"):
+        pytest.skip("DATABASE_URL is not set")
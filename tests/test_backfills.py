@@ -0,0 +1,172 @@
+import asyncio
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+import backfills
+from backfills import ASSOCIATION_PRICE, CATEGORY_IDS, backfill_completed
+from category.utils import get_categories_for_products
+from product.utils import (
+    get_product_category_ids,
+    get_products_by_category,
+    get_products_by_ids,
+    get_unique_products_count,
+)
+
+
+class Result(list):
+    def scalar(self):
+        return self[0] if self else None
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return list(self)
+
+
+class Session:
+    """Answers the backfill check with `backfilled`, records every query."""
+
+    def __init__(self, backfilled, results=()):
+        self.backfilled = backfilled
+        self.results = list(results)
+        self.checks = 0
+        self.statements = []
+
+    async def scalar(self, statement):
+        self.checks += 1
+        return self.backfilled
+
+    async def execute(self, statement):
+        self.statements.append(
+            str(statement.compile(dialect=postgresql.asyncpg.dialect()))
+        )
+        return Result(self.results.pop(0) if self.results else [])
+
+
+def test_completed_backfill_is_not_checked_again(completed_backfills):
+    completed_backfills.clear()
+    session = Session(backfilled=True)
+
+    async def run():
+        return [await backfill_completed(session, CATEGORY_IDS) for _ in range(3)]
+
+    assert asyncio.run(run()) == [True, True, True]
+    assert session.checks == 1
+
+
+def test_pending_backfill_is_checked_once_per_interval(completed_backfills, monkeypatch):
+    completed_backfills.clear()
+    session = Session(backfilled=False)
+
+    async def run():
+        return [await backfill_completed(session, CATEGORY_IDS) for _ in range(3)]
+
+    assert asyncio.run(run()) == [False, False, False]
+    assert session.checks == 1
+
+    monkeypatch.setattr(backfills, "BACKFILL_RECHECK_INTERVAL", 0)
+    session.backfilled = True
+    assert asyncio.run(run()) == [True, True, True]
+    assert session.checks == 2
+
+
+def queries(completed_backfills, backfilled, query, results=(), name=CATEGORY_IDS):
+    if backfilled:
+        completed_backfills.add(name)
+    else:
+        completed_backfills.discard(name)
+    session = Session(backfilled=False, results=results)
+    asyncio.run(query(session))
+    return session.statements
+
+
+def test_products_by_ids_read_category_ids_from_the_association(completed_backfills):
+    def query(session):
+        return get_products_by_ids(session=session, product_ids=[1])
+
+    (pending,) = queries(completed_backfills, False, query)
+    (completed,) = queries(completed_backfills, True, query)
+
+    assert "FROM product_category_association" in pending
+    assert "product_category_association" not in completed
+    assert "product.category_ids" in completed
+
+
+def test_category_tree_joins_the_association_until_backfilled(completed_backfills):
+    def query(session):
+        return get_products_by_category(session=session, category_id=1)
+
+    (pending,) = queries(completed_backfills, False, query)
+    (completed,) = queries(completed_backfills, True, query)
+
+    assert "product.id IN (SELECT product_category_association.product_id" in pending
+    assert "&&" not in pending
+    assert "product.category_ids && array(" in completed
+
+
+def test_top_products_by_price_sort_on_product_until_backfilled(completed_backfills):
+    def query(session):
+        return get_products_by_category(
+            session=session, category_id=1, fields=["id"], sort="-price", limit=2
+        )
+
+    (pending,) = queries(completed_backfills, False, query, name=ASSOCIATION_PRICE)
+    top = [
+        SimpleNamespace(category_id=1, product_id=7, price=3.0),
+        SimpleNamespace(category_id=2, product_id=8, price=5.0),
+    ]
+    products = [SimpleNamespace(id=7), SimpleNamespace(id=8)]
+    completed = queries(
+        completed_backfills,
+        True,
+        query,
+        results=[top, products],
+        name=ASSOCIATION_PRICE,
+    )
+
+    # NULL prices of rows written before the backfill never reach the merge
+    assert "product_category_association.price" not in pending
+    assert "ORDER BY product.price DESC, product.id DESC" in pending
+    assert "LIMIT" in pending
+    assert "LATERAL" in completed[0]
+    assert "product_category_association.price DESC" in completed[0]
+
+
+def test_unique_count_joins_the_association_until_backfilled(completed_backfills):
+    def query(session):
+        return get_unique_products_count(session=session, category_ids=[1])
+
+    _, pending = queries(completed_backfills, False, query, results=[[1], [5]])
+    _, completed = queries(completed_backfills, True, query, results=[[1], [5]])
+
+    assert "count(DISTINCT product_category_association.product_id)" in pending
+    assert "product.category_ids &&" in completed
+
+
+def test_categories_for_products_join_the_association_until_backfilled(
+    completed_backfills,
+):
+    def query(session):
+        return get_categories_for_products(session=session, product_ids=[1])
+
+    (pending,) = queries(completed_backfills, False, query)
+    (completed,) = queries(completed_backfills, True, query)
+
+    assert "JOIN product_category_association" in pending
+    assert "ANY (product.category_ids)" not in pending
+    assert "ANY (product.category_ids)" in completed
+
+
+def test_writes_read_old_category_ids_from_the_association(completed_backfills):
+    product = SimpleNamespace(id=1, category_ids=[])
+
+    def query(session):
+        return get_product_category_ids(session, product)
+
+    completed_backfills.clear()
+    session = Session(backfilled=False, results=[[4, 5]])
+
+    assert asyncio.run(query(session)) == [4, 5]
+    assert len(session.statements) == 1
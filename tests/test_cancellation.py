@@ -0,0 +1,177 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import DBAPIError
+
+import cancellation
+from cancellation import QUERY_CANCELED, run_until_disconnected
+from database import engine, get_session_with_timeout
+from exceptions import ClientDisconnectedError, StatementTimeoutError
+
+
+class Request:
+    """Stands in for starlette's Request, disconnects after `polls` checks."""
+
+    def __init__(self, polls=None):
+        self.polls = polls
+        self.checks = 0
+
+    async def is_disconnected(self) -> bool:
+        self.checks += 1
+        return self.polls is not None and self.checks >= self.polls
+
+
+class DriverError(Exception):
+    def __init__(self, sqlstate):
+        super().__init__(sqlstate)
+        self.sqlstate = sqlstate
+
+
+def database_error(sqlstate):
+    return DBAPIError("SELECT 1", None, DriverError(sqlstate))
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(cancellation, "DISCONNECT_POLL_INTERVAL", 0.01)
+
+
+def test_returns_the_result_while_the_client_stays():
+    async def query():
+        await asyncio.sleep(0.05)
+        return 42
+
+    assert asyncio.run(run_until_disconnected(Request(), query())) == 42
+
+
+def test_cancels_the_query_when_the_client_disconnects():
+    cancelled = []
+
+    async def query():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    started = time.monotonic()
+    with pytest.raises(ClientDisconnectedError):
+        asyncio.run(run_until_disconnected(Request(polls=3), query()))
+
+    assert cancelled == [True]
+    assert time.monotonic() - started < 1
+
+
+def test_waits_for_the_cancelled_query_to_finish():
+    events = []
+
+    async def query():
+        try:
+            await asyncio.sleep(10)
+        finally:
+            # Like asyncpg waiting for its cancel request, the session must be
+            # idle again before the router rolls back
+            await asyncio.sleep(0.05)
+            events.append("query finished")
+
+    async def run():
+        try:
+            await run_until_disconnected(Request(polls=1), query())
+        except ClientDisconnectedError:
+            events.append("disconnected")
+
+    asyncio.run(run())
+
+    assert events == ["query finished", "disconnected"]
+
+
+def test_statement_timeout_raises_statement_timeout_error():
+    async def query():
+        raise database_error(QUERY_CANCELED)
+
+    with pytest.raises(StatementTimeoutError):
+        asyncio.run(run_until_disconnected(Request(), query()))
+
+
+def test_other_database_errors_pass_through():
+    async def query():
+        raise database_error("23505")
+
+    with pytest.raises(DBAPIError):
+        asyncio.run(run_until_disconnected(Request(), query()))
+
+
+def test_cancelling_the_caller_cancels_the_query():
+    cancelled = []
+
+    async def query():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        caller = asyncio.ensure_future(run_until_disconnected(Request(), query()))
+        await asyncio.sleep(0.05)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+    assert cancelled == [True]
+
+
+def sleep_in_database(timeout, seconds, request):
+    async def run():
+        try:
+            sessions = get_session_with_timeout(timeout)()
+            session = await sessions.__anext__()
+            try:
+                return await run_until_disconnected(
+                    request, session.execute(select(func.pg_sleep(seconds)))
+                )
+            finally:
+                await session.rollback()
+                await sessions.aclose()
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_statement_timeout_is_set_per_transaction(database):
+    async def run():
+        try:
+            sessions = get_session_with_timeout(1234)()
+            session = await sessions.__anext__()
+            try:
+                first = await session.scalar(select(func.current_setting("statement_timeout")))
+                await session.rollback()
+                second = await session.scalar(
+                    select(func.current_setting("statement_timeout"))
+                )
+            finally:
+                await sessions.aclose()
+        finally:
+            await engine.dispose()
+        return first, second
+
+    assert asyncio.run(run()) == ("1234ms", "1234ms")
+
+
+def test_postgres_statement_timeout(database):
+    with pytest.raises(StatementTimeoutError):
+        sleep_in_database(100, 5, Request())
+
+
+def test_postgres_query_is_cancelled_on_disconnect(database):
+    started = time.monotonic()
+    with pytest.raises(ClientDisconnectedError):
+        sleep_in_database(0, 10, Request(polls=5))
+
+    assert time.monotonic() - started < 5
@@ -0,0 +1,198 @@
+"""Run get_categories_for_products against Postgres, with and without the
+category_ids backfill completed.
+
+Needs DATABASE_URL pointing at a migrated database, everything the tests
+write is rolled back.
+"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import category.router
+from backfills import CATEGORY_IDS
+from category.models import Category
+from category.schemas import CATEGORY_FIELDS
+from category.utils import get_categories_for_products
+from config import STATEMENT_TIMEOUT
+from database import async_session_maker, engine, get_session_with_timeout
+from main import app
+from product.models import Product
+from product.utils import add_product_categories
+
+
+@pytest.fixture(params=["backfilled", "pending"])
+def backfill(request, completed_backfills):
+    if request.param == "pending":
+        completed_backfills.discard(CATEGORY_IDS)
+    return request.param
+
+
+async def add_category(session, name: str) -> int:
+    category = Category(name=name)
+    session.add(category)
+    await session.flush()
+    return category.id
+
+
+async def add_product(session, name: str, category_ids) -> int:
+    product = Product(name=name, price=1.0, category_ids=list(category_ids))
+    session.add(product)
+    await session.flush()
+    await add_product_categories(session, product.id, list(category_ids), 1.0)
+    return product.id
+
+
+def categories_for_products(build, fields=CATEGORY_FIELDS):
+    """Create rows with `build(session)`, then map the product ids it returns.
+
+    Returns the ids `build` created and the mapping, the rows are rolled back.
+    """
+    async def run():
+        try:
+            async with async_session_maker() as session:
+                try:
+                    ids, product_ids = await build(session)
+                    mapping = await get_categories_for_products(
+                        session=session, product_ids=product_ids, fields=fields
+                    )
+                    return ids, mapping
+                finally:
+                    await session.rollback()
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+async def catalog(session):
+    shoes = await add_category(session, "shoes")
+    sale = await add_category(session, "sale")
+    boots = await add_product(session, "boots", [shoes, sale])
+    sandals = await add_product(session, "sandals", [shoes])
+    gift_card = await add_product(session, "gift card", [])
+    return {
+        "shoes": shoes,
+        "sale": sale,
+        "boots": boots,
+        "sandals": sandals,
+        "gift_card": gift_card,
+    }
+
+
+def category_row(ids, name):
+    return {"id": ids[name], "name": name, "parent_id": None}
+
+
+def test_products_sharing_a_category(database, backfill):
+    async def build(session):
+        ids = await catalog(session)
+        return ids, [ids["boots"], ids["sandals"]]
+
+    ids, mapping = categories_for_products(build)
+
+    assert sorted(mapping[ids["boots"]], key=lambda row: row["id"]) == [
+        category_row(ids, "shoes"),
+        category_row(ids, "sale"),
+    ]
+    assert mapping[ids["sandals"]] == [category_row(ids, "shoes")]
+    # Read once for both products, the same dict is shared
+    shoes = next(row for row in mapping[ids["boots"]] if row["name"] == "shoes")
+    assert shoes is mapping[ids["sandals"]][0]
+
+
+def test_product_without_categories_maps_to_an_empty_list(database, backfill):
+    async def build(session):
+        ids = await catalog(session)
+        return ids, [ids["gift_card"], ids["sandals"]]
+
+    ids, mapping = categories_for_products(build)
+
+    assert mapping == {
+        ids["gift_card"]: [],
+        ids["sandals"]: [category_row(ids, "shoes")],
+    }
+
+
+def test_missing_product_is_left_out(database, backfill):
+    async def build(session):
+        ids = await catalog(session)
+        # Above every id in the database, never a product
+        missing = ids["gift_card"] + 1_000_000
+        ids["missing"] = missing
+        return ids, [missing, ids["gift_card"], ids["boots"]]
+
+    ids, mapping = categories_for_products(build)
+
+    assert set(mapping) == {ids["gift_card"], ids["boots"]}
+    assert mapping[ids["gift_card"]] == []
+
+
+def test_only_missing_products(database, backfill):
+    async def build(session):
+        return {}, [2_000_000_000, 2_000_000_001]
+
+    _, mapping = categories_for_products(build)
+
+    assert mapping == {}
+
+
+def test_duplicate_ids_are_mapped_once(database, backfill):
+    async def build(session):
+        ids = await catalog(session)
+        return ids, [
+            ids["sandals"],
+            ids["sandals"],
+            ids["gift_card"],
+            ids["gift_card"],
+        ]
+
+    ids, mapping = categories_for_products(build)
+
+    assert mapping == {
+        ids["sandals"]: [category_row(ids, "shoes")],
+        ids["gift_card"]: [],
+    }
+
+
+def test_selected_fields_only(database, backfill):
+    async def build(session):
+        ids = await catalog(session)
+        return ids, [ids["sandals"]]
+
+    ids, mapping = categories_for_products(build, fields=["name"])
+
+    assert mapping == {ids["sandals"]: [{"name": "shoes"}]}
+
+
+@pytest.fixture
+def session():
+    class Session:
+        async def rollback(self):
+            pass
+
+    app.dependency_overrides[get_session_with_timeout(STATEMENT_TIMEOUT)] = Session
+    yield
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize(
+    "product_ids, status_code",
+    [([1, 2], 404), ([1, 1], 200), ([1, 3], 200)],
+)
+def test_router_returns_404_when_a_product_is_missing(
+    session, monkeypatch, product_ids, status_code
+):
+    # 1 and 3 exist, 2 does not; duplicates count once
+    async def get_categories_for_products(session, product_ids, fields):
+        return {product_id: [] for product_id in set(product_ids) if product_id != 2}
+
+    monkeypatch.setattr(
+        category.router, "get_categories_for_products", get_categories_for_products
+    )
+
+    response = TestClient(app).get(
+        "/api/v1.0/categories/by_product_ids", params={"product_ids": product_ids}
+    )
+
+    assert response.status_code == status_code
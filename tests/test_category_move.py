@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+from sqlalchemy import insert, select
+
+import category.utils
+from category.models import Category
+from category.utils import (
+    category_move_event,
+    check_category_parent,
+    get_category_subtree_ids,
+)
+from database import async_session_maker, engine
+from events.utils import MAX_EVENT_IDS, OVERFLOW_EVENT
+from exceptions import CategoryCycleError
+
+
+def moved_category():
+    category = Category(name="moved", parent_id=2)
+    category.id = 5
+    return category
+
+
+def test_move_event_lists_the_subtree(monkeypatch):
+    async def get_category_subtree_ids(session, category_ids, limit=None):
+        return [5, 6, 7]
+
+    monkeypatch.setattr(category.utils, "get_category_subtree_ids", get_category_subtree_ids)
+
+    event = asyncio.run(category_move_event(None, moved_category()))
+
+    assert event == {
+        "entity": "category",
+        "action": "update",
+        "id": 5,
+        "parent_id": 2,
+        "subtree_ids": [5, 6, 7],
+    }
+
+
+def test_move_event_of_a_large_subtree_is_an_overflow(monkeypatch):
+    limits = []
+
+    async def get_category_subtree_ids(session, category_ids, limit=None):
+        limits.append(limit)
+        return list(range(limit))
+
+    monkeypatch.setattr(category.utils, "get_category_subtree_ids", get_category_subtree_ids)
+
+    event = asyncio.run(category_move_event(None, moved_category()))
+
+    assert event == OVERFLOW_EVENT
+    assert limits == [MAX_EVENT_IDS + 1]
+
+
+def in_transaction(test):
+    """Run `test(session)` and roll back everything it wrote."""
+    async def run():
+        try:
+            async with async_session_maker() as session:
+                try:
+                    return await test(session)
+                finally:
+                    await session.rollback()
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+async def add_chain(session, length: int):
+    ids = []
+    parent_id = None
+    for _ in range(length):
+        category = Category(name="chain", parent_id=parent_id)
+        session.add(category)
+        await session.flush()
+        ids.append(category.id)
+        parent_id = category.id
+    return ids
+
+
+def test_move_into_own_subtree_is_a_cycle(database):
+    async def test(session):
+        root, child, grandchild = await add_chain(session, 3)
+
+        with pytest.raises(CategoryCycleError):
+            await check_category_parent(session, root, grandchild)
+        with pytest.raises(CategoryCycleError):
+            await check_category_parent(session, child, child)
+        await check_category_parent(session, grandchild, root)
+
+    in_transaction(test)
+
+
+def test_subtree_read_stops_at_the_limit(database):
+    async def test(session):
+        (root,) = await add_chain(session, 1)
+        await session.execute(
+            insert(Category),
+            [{"name": "leaf", "parent_id": root}] * (MAX_EVENT_IDS + 10),
+        )
+
+        capped = await get_category_subtree_ids(session, [root], limit=MAX_EVENT_IDS + 1)
+        event = await category_move_event(
+            session, await session.scalar(select(Category).filter_by(id=root))
+        )
+        return capped, event
+
+    capped, event = in_transaction(test)
+
+    assert len(capped) == MAX_EVENT_IDS + 1
+    assert event == OVERFLOW_EVENT
+
+
+def test_tree_moves_are_serialized(database):
+    async def run():
+        try:
+            async with async_session_maker() as first, async_session_maker() as second:
+                await check_category_parent(first, 0, 1)
+                waiting = asyncio.ensure_future(check_category_parent(second, 0, 1))
+
+                await asyncio.sleep(0.2)
+                assert not waiting.done()
+
+                await first.rollback()
+                await asyncio.wait_for(waiting, timeout=5)
+                await second.rollback()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
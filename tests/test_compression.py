@@ -0,0 +1,211 @@
+import asyncio
+import gzip
+import zlib
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import compression
+from compression import (
+    CompressedBodyCache,
+    CompressionMiddleware,
+    GzipStream,
+    select_encoding,
+)
+
+
+MINIMUM_SIZE = 100
+BODY = "catalog " * 100
+
+
+@pytest.fixture
+def encodings(monkeypatch):
+    # Every codec, in the order the server prefers them
+    monkeypatch.setattr(
+        compression,
+        "ENCODINGS",
+        {"zstd": GzipStream, "br": GzipStream, "gzip": GzipStream},
+    )
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [
+        ("gzip, br, zstd", "zstd"),
+        ("gzip;q=1.0, br;q=0.1", "gzip"),
+        ("br;q=0.5, gzip;q=0.8, zstd;q=0.2", "gzip"),
+        ("gzip;q=0.5, br;q=0.5", "br"),
+        ("*;q=0.3, gzip;q=0.9", "gzip"),
+        ("*", "zstd"),
+        ("GZIP", "gzip"),
+        ("gzip;q=0, br;q=0", None),
+        ("identity", None),
+        ("gzip;q=oops", None),
+        ("", None),
+    ],
+)
+def test_select_encoding(encodings, accept_encoding, encoding):
+    assert select_encoding(accept_encoding) == encoding
+
+
+def test_cache_evicts_least_recently_used():
+    cache = CompressedBodyCache(max_size=10)
+    first, second, third = (cache.key("gzip", body) for body in (b"1", b"2", b"3"))
+
+    cache.put(first, b"aaaa")
+    cache.put(second, b"bbbb")
+    assert cache.get(first) == b"aaaa"
+    cache.put(third, b"cccc")
+
+    assert cache.get(second) is None
+    assert cache.get(first) == b"aaaa"
+    assert cache.get(third) == b"cccc"
+    assert cache.size == 8
+
+
+def test_cache_skips_bodies_larger_than_itself():
+    cache = CompressedBodyCache(max_size=3)
+    key = cache.key("gzip", b"body")
+
+    cache.put(key, b"four")
+
+    assert cache.get(key) is None
+    assert cache.size == 0
+
+
+def homepage(request):
+    return PlainTextResponse(BODY)
+
+
+def small(request):
+    return PlainTextResponse("tiny")
+
+
+def events(request):
+    async def stream():
+        yield "data: 1\n\n" * 50
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def encoded(request):
+    return Response(gzip.compress(b"x" * 1000), headers={"Content-Encoding": "gzip"})
+
+
+@pytest.fixture
+def client():
+    app = Starlette(
+        routes=[
+            Route("/", homepage),
+            Route("/small", small),
+            Route("/events", events),
+            Route("/encoded", encoded),
+        ]
+    )
+    app.add_middleware(
+        CompressionMiddleware, minimum_size=MINIMUM_SIZE, level=5, cache_size=1024
+    )
+    return TestClient(app)
+
+
+def test_response_is_compressed_with_the_negotiated_encoding(client):
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.text == BODY
+    assert int(response.headers["content-length"]) < len(BODY)
+
+
+def test_response_is_not_compressed_without_accept_encoding(client):
+    response = client.get("/", headers={"Accept-Encoding": "identity"})
+
+    assert "content-encoding" not in response.headers
+    assert response.text == BODY
+
+
+def test_small_response_is_not_compressed(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.text == "tiny"
+
+
+def test_event_stream_passes_through(client):
+    response = client.get("/events", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.text == "data: 1\n\n" * 50
+
+
+def test_encoded_response_passes_through(client):
+    response = client.get("/encoded", headers={"Accept-Encoding": "br"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == b"x" * 1000
+
+
+def test_identical_bodies_are_compressed_once(client, monkeypatch):
+    calls = []
+    real_compress = compression.compress
+
+    def counting_compress(encoding, level, body):
+        calls.append(encoding)
+        return real_compress(encoding, level, body)
+
+    monkeypatch.setattr(compression, "compress", counting_compress)
+
+    for _ in range(3):
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+        assert response.text == BODY
+
+    assert calls == ["gzip"]
+
+
+def test_streamed_chunks_are_flushed_one_by_one():
+    chunks = [b"first chunk " * 20, b"second chunk " * 20, b"last chunk " * 20]
+
+    async def app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        for index, chunk in enumerate(chunks):
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": index < len(chunks) - 1,
+                }
+            )
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    middleware = CompressionMiddleware(
+        app, minimum_size=MINIMUM_SIZE, level=5, cache_size=1024
+    )
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(middleware(scope, receive, send))
+
+    start, *bodies = messages
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+
+    # Each chunk decodes as soon as it arrives, nothing waits for the next one
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert [decompressor.decompress(body["body"]) for body in bodies] == chunks
+    assert [body["more_body"] for body in bodies] == [True, True, False]
+    assert gzip.decompress(b"".join(body["body"] for body in bodies)) == b"".join(chunks)
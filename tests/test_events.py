@@ -0,0 +1,302 @@
+import asyncio
+import json
+
+import asyncpg
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import events.router
+import events.utils
+from config import EVENTS_CHANNEL
+from database import async_session_maker, engine
+from events.utils import (
+    LISTEN_DSN,
+    NOTIFY_PAYLOAD_LIMIT,
+    OVERFLOW_EVENT,
+    CatalogEventBroker,
+    Subscription,
+    broker,
+    catalog_change_payload,
+    notify_catalog_change,
+)
+from main import app
+
+
+STREAM = "/api/v1.0/events/stream"
+WS = "/api/v1.0/events/ws"
+
+
+def product_event(product_id, category_ids=(), action="update"):
+    return {
+        "entity": "product",
+        "action": action,
+        "id": product_id,
+        "category_ids": list(category_ids),
+    }
+
+
+def category_event(category_id, parent_id, action="create"):
+    return {
+        "entity": "category",
+        "action": action,
+        "id": category_id,
+        "parent_id": parent_id,
+    }
+
+
+def drain(subscription):
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait())
+    return events
+
+
+def test_subscription_matches_products_by_id_and_category():
+    subscription = Subscription([1], [10, 11], queue_size=8)
+
+    assert subscription.matches(product_event(1))
+    assert subscription.matches(product_event(2, [11, 99]))
+    assert not subscription.matches(product_event(3, [99]))
+
+
+def test_subscription_follows_categories_created_in_subtree():
+    subscription = Subscription([], [10], queue_size=8)
+
+    assert subscription.matches(category_event(12, parent_id=10))
+    assert subscription.matches(product_event(5, [12]))
+    assert not subscription.matches(category_event(13, parent_id=99))
+
+
+def move_event(category_id, parent_id, subtree_ids):
+    event = category_event(category_id, parent_id, action="update")
+    event["subtree_ids"] = subtree_ids
+    return event
+
+
+def test_subtree_moved_into_subscription_is_followed():
+    subscription = Subscription([], [10], queue_size=8)
+
+    assert subscription.matches(move_event(20, parent_id=10, subtree_ids=[20, 21]))
+    assert subscription.matches(product_event(5, [21]))
+    assert not subscription.overflowed
+
+
+def test_subtree_moved_out_of_subscription_resyncs():
+    subscription = Subscription([], [10, 11, 12], queue_size=8)
+
+    assert not subscription.matches(move_event(11, parent_id=99, subtree_ids=[11, 12]))
+    assert drain(subscription) == [OVERFLOW_EVENT]
+
+
+def test_unrelated_move_is_ignored():
+    subscription = Subscription([], [10], queue_size=8)
+
+    assert not subscription.matches(move_event(20, parent_id=30, subtree_ids=[20]))
+    assert not subscription.overflowed
+
+
+def test_overflow_events_match_every_subscription():
+    assert Subscription([1], [], queue_size=8).matches(OVERFLOW_EVENT)
+
+
+def test_offer_resyncs_a_slow_subscriber():
+    subscription = Subscription([1], [], queue_size=2)
+
+    for _ in range(3):
+        subscription.offer(product_event(1))
+    subscription.offer(product_event(1))
+
+    assert subscription.overflowed
+    assert drain(subscription) == [OVERFLOW_EVENT]
+
+
+def test_offer_of_a_notified_overflow_resyncs():
+    subscription = Subscription([1], [], queue_size=8)
+    subscription.offer(product_event(1))
+
+    subscription.offer(json.loads(json.dumps(OVERFLOW_EVENT)))
+
+    assert drain(subscription) == [OVERFLOW_EVENT]
+
+
+def test_publish_delivers_to_matching_subscriptions_only():
+    broker = CatalogEventBroker("test", queue_size=8)
+    interested = Subscription([1], [], queue_size=8)
+    other = Subscription([2], [], queue_size=8)
+    broker._subscriptions.update({interested, other})
+
+    event = product_event(1)
+    broker.publish(event)
+
+    assert drain(interested) == [event]
+    assert drain(other) == []
+
+
+def test_payload_keeps_small_events():
+    event = product_event(1, range(10))
+
+    assert json.loads(catalog_change_payload(event)) == event
+
+
+def test_payload_falls_back_to_overflow_when_too_large():
+    event = product_event(1, range(100000, 100000 + NOTIFY_PAYLOAD_LIMIT // 4))
+
+    assert json.loads(catalog_change_payload(event)) == OVERFLOW_EVENT
+
+
+def test_notify_is_delivered_after_commit(database):
+    async def run():
+        received = asyncio.Queue()
+        connection = await asyncpg.connect(LISTEN_DSN)
+        await connection.add_listener(
+            EVENTS_CHANNEL, lambda *args: received.put_nowait(args[-1])
+        )
+        try:
+            async with async_session_maker() as session:
+                event = product_event(1, [2, 3])
+                await notify_catalog_change(session, event)
+                await asyncio.sleep(0.1)
+                assert received.empty()
+                await session.commit()
+
+            payload = await asyncio.wait_for(received.get(), timeout=5)
+            assert json.loads(payload) == event
+        finally:
+            await connection.close()
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_held_subscription_matches_events_once_the_subtree_is_known():
+    subscription = Subscription([], [10], queue_size=8, held=True)
+    subscription.deliver(category_event(30, parent_id=20))
+    subscription.deliver(product_event(5, [30]))
+    subscription.deliver(product_event(6, [99]))
+
+    assert drain(subscription) == []
+
+    subscription.follow([10, 20])
+
+    assert drain(subscription) == [category_event(30, parent_id=20), product_event(5, [30])]
+    subscription.deliver(product_event(7, [30]))
+    assert drain(subscription) == [product_event(7, [30])]
+
+
+def test_held_subscription_resyncs_when_too_many_events_arrive(monkeypatch):
+    monkeypatch.setattr(events.utils, "EVENTS_HELD_SIZE", 2)
+    subscription = Subscription([1], [], queue_size=8, held=True)
+
+    for _ in range(3):
+        subscription.deliver(product_event(1))
+    subscription.follow([])
+
+    assert drain(subscription) == [OVERFLOW_EVENT]
+
+
+@pytest.fixture
+def subscribe_to(monkeypatch):
+    """Serve the events endpoints without Postgres.
+
+    `published` events arrive while the subtree is read, like changes
+    committed between subscribing and reading it, `later` ones after `delay`.
+    """
+    async def start():
+        pass
+
+    monkeypatch.setattr(broker, "start", start)
+    monkeypatch.setattr(events.router, "EVENTS_HEARTBEAT_INTERVAL", 0.01)
+
+    def subscribe_to(subtrees, published=(), later=(), delay=0.1):
+        async def resolve_category_subtree(category_ids):
+            for event in published:
+                broker.publish(event)
+            for event in later:
+                asyncio.get_running_loop().call_later(delay, broker.publish, event)
+            subtree_ids = []
+            for category_id in category_ids:
+                if category_id not in subtrees:
+                    raise LookupError
+                subtree_ids.extend(subtrees[category_id])
+            return subtree_ids
+
+        monkeypatch.setattr(
+            events.router, "resolve_category_subtree", resolve_category_subtree
+        )
+
+    yield subscribe_to
+
+    assert not broker._subscriptions
+
+
+def sse_events(response):
+    return [
+        json.loads(line[len("data: "):])
+        for line in response.text.splitlines()
+        if line.startswith("data: ")
+    ]
+
+
+def test_stream_delivers_events_sent_while_the_subtree_is_read(subscribe_to):
+    subscribe_to(
+        {10: [10, 20]},
+        published=[category_event(30, parent_id=20), product_event(5, [30])],
+        later=[OVERFLOW_EVENT],
+    )
+
+    response = TestClient(app).get(STREAM, params={"category_ids": [10]})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert sse_events(response) == [
+        category_event(30, parent_id=20),
+        product_event(5, [30]),
+        OVERFLOW_EVENT,
+    ]
+
+
+def test_stream_sends_keep_alive_while_idle(subscribe_to):
+    subscribe_to({}, later=[OVERFLOW_EVENT])
+
+    response = TestClient(app).get(STREAM, params={"product_ids": [1]})
+
+    assert response.text.startswith(": keep-alive\n\n")
+    assert sse_events(response) == [OVERFLOW_EVENT]
+
+
+def test_stream_rejects_empty_subscription(subscribe_to):
+    response = TestClient(app).get(STREAM)
+
+    assert response.status_code == 400
+
+
+def test_stream_rejects_missing_category(subscribe_to):
+    subscribe_to({10: [10]})
+
+    response = TestClient(app).get(STREAM, params={"category_ids": [10, 11]})
+
+    assert response.status_code == 404
+
+
+def test_websocket_closes_with_1013_on_overflow(subscribe_to):
+    subscribe_to({10: [10, 20]}, published=[product_event(5, [20])], later=[OVERFLOW_EVENT])
+
+    with TestClient(app).websocket_connect(WS + "?category_ids=10") as websocket:
+        assert websocket.receive_json() == product_event(5, [20])
+        assert websocket.receive_json() == OVERFLOW_EVENT
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+
+    assert closed.value.code == 1013
+
+
+@pytest.mark.parametrize("query", ["", "?category_ids=11"])
+def test_websocket_rejects_bad_subscription(subscribe_to, query):
+    subscribe_to({10: [10]})
+
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with TestClient(app).websocket_connect(WS + query):
+            pass
+
+    assert closed.value.code == 1008
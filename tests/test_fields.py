@@ -0,0 +1,143 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.sql.util import find_tables
+
+from config import COUNT_STATEMENT_TIMEOUT, STATEMENT_TIMEOUT, TREE_STATEMENT_TIMEOUT
+from database import get_session_with_timeout
+from exceptions import InvalidFieldsError
+from fields import parse_fields
+from main import app
+from product.schemas import PRODUCT_FIELDS
+
+
+@pytest.mark.parametrize("fields", [None, ""])
+def test_no_fields_means_every_field(fields):
+    assert parse_fields(fields, PRODUCT_FIELDS) == list(PRODUCT_FIELDS)
+
+
+def test_fields_keep_the_allowed_order():
+    assert parse_fields("price, id,price", PRODUCT_FIELDS) == ["id", "price"]
+
+
+@pytest.mark.parametrize("fields", ["id,colour", ",", " , "])
+def test_unknown_or_empty_fields_are_rejected(fields):
+    with pytest.raises(InvalidFieldsError):
+        parse_fields(fields, PRODUCT_FIELDS)
+
+
+class Session:
+    """Records the statements of the real utils and answers with `results`."""
+
+    def __init__(self):
+        self.results = []
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        return self.results.pop(0)
+
+    async def rollback(self):
+        pass
+
+    def tables(self):
+        return [
+            {table.name for table in find_tables(statement)}
+            for statement in self.statements
+        ]
+
+    def columns(self):
+        return [
+            [column.name for column in statement.selected_columns]
+            for statement in self.statements
+        ]
+
+
+@pytest.fixture
+def session():
+    session = Session()
+    for timeout in (STATEMENT_TIMEOUT, TREE_STATEMENT_TIMEOUT, COUNT_STATEMENT_TIMEOUT):
+        app.dependency_overrides[get_session_with_timeout(timeout)] = lambda: session
+
+    yield session
+
+    app.dependency_overrides.clear()
+
+
+def get(path, **params):
+    return TestClient(app).get(path, params=params)
+
+
+def test_products_select_and_return_only_requested_fields(session):
+    session.results = [[SimpleNamespace(id=1, price=10.5)]]
+
+    response = get("/api/v1.0/products", ids=[1], fields="price,id")
+
+    assert response.status_code == 200
+    assert response.json()["data"] == [{"id": 1, "price": 10.5}]
+    assert list(response.json()["data"][0]) == ["id", "price"]
+    assert session.columns() == [["id", "price"]]
+
+
+def test_categories_without_product_ids_skip_the_association(session):
+    session.results = [[SimpleNamespace(id=1, name="shoes")]]
+
+    response = get("/api/v1.0/categories", ids=[1], fields="name,id")
+
+    assert response.json()["data"] == [{"id": 1, "name": "shoes"}]
+    assert session.tables() == [{"category"}]
+
+
+def test_categories_with_product_ids_read_the_association(session):
+    session.results = [[SimpleNamespace(id=1)], [(1, 7), (1, 8)]]
+
+    response = get("/api/v1.0/categories", ids=[1], fields="product_ids")
+
+    assert response.json()["data"] == [{"product_ids": [7, 8]}]
+    assert session.tables() == [{"category"}, {"product_category_association"}]
+
+
+def test_count_without_products_count_skips_the_join(session):
+    session.results = [[SimpleNamespace(category_id=1, category_name="shoes")]]
+
+    response = get(
+        "/api/v1.0/categories/with_product_count",
+        category_ids=[1],
+        fields="category_name",
+    )
+
+    assert response.json()["data"] == [{"category_name": "shoes"}]
+    assert session.tables() == [{"category"}]
+
+
+def test_count_with_products_count_joins_the_association(session):
+    session.results = [
+        [SimpleNamespace(category_id=1, category_name="shoes", products_count=3)]
+    ]
+
+    response = get("/api/v1.0/categories/with_product_count", category_ids=[1])
+
+    assert response.json()["data"] == [
+        {"category_id": 1, "category_name": "shoes", "products_count": 3}
+    ]
+    assert session.tables() == [{"category", "product_category_association", "product"}]
+
+
+@pytest.mark.parametrize(
+    "path, params",
+    [
+        ("/api/v1.0/products", {"ids": [1]}),
+        ("/api/v1.0/products/by_category_tree", {"parent_category_id": 1}),
+        ("/api/v1.0/categories", {"ids": [1]}),
+        ("/api/v1.0/categories/by_product_ids", {"product_ids": [1]}),
+        ("/api/v1.0/categories/with_product_count", {"category_ids": [1]}),
+    ],
+)
+@pytest.mark.parametrize("fields", ["colour", ","])
+def test_bad_fields_return_400_without_a_query(session, path, params, fields):
+    response = get(path, fields=fields, **params)
+
+    assert response.status_code == 400
+    assert response.json()["detail"]["detail"] == "Unknown field requested"
+    assert session.statements == []
@@ -0,0 +1,171 @@
+"""EXPLAIN the statements the utils issue and count the partitions scanned.
+
+Needs DATABASE_URL pointing at a database migrated past 8e4a2f6c1d93.
+
+Pruned to the partitions of the requested ids:
+    product.utils.get_products_by_ids
+
+Expected to list every product partition, nothing to prune on:
+    product.utils.get_products_by_category (category_ids && ARRAY[...])
+    product.utils.get_unique_products_count (category_ids && ARRAY[...])
+    category.utils.get_categories_for_products (product joined on a CTE of
+    ids, pruned per row at run time but planned against every partition)
+
+Lists every association partition with HASH (product_id), pruned with
+ASSOCIATION_PARTITIONING=range as it filters on category_id = ANY(...):
+    category.utils.get_categories_by_ids (product_ids field)
+
+Expected to list every association partition, the category ids come from a
+join (category subtree, category table) and can only be pruned at run time:
+    product.utils.get_top_product_ids_by_price
+    category.utils.get_categories_with_product_count
+"""
+import asyncio
+import json
+from collections import defaultdict
+
+import pytest
+from sqlalchemy import event, text
+
+from config import ASSOCIATION_PARTITIONING
+from database import async_session_maker, engine
+from category.utils import (
+    get_categories_by_ids,
+    get_categories_for_products,
+    get_categories_with_product_count,
+)
+from product.utils import (
+    get_products_by_category,
+    get_products_by_ids,
+    get_top_product_ids_by_price,
+    get_unique_products_count,
+)
+
+
+PRODUCT = "product"
+ASSOCIATION = "product_category_association"
+
+PARTITIONS = text("""
+    SELECT inhrelid::regclass::text AS partition, inhparent::regclass::text AS parent
+    FROM pg_inherits
+    WHERE inhparent IN ('product'::regclass, 'product_category_association'::regclass)
+""")
+
+
+def scanned_relations(plan: dict):
+    if "Relation Name" in plan:
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", ()):
+        yield from scanned_relations(child)
+
+
+async def explain_partitions(query):
+    """Run `query(session)` and EXPLAIN each SELECT it sent.
+
+    Returns the partitions scanned and the partitions that exist, both as
+    {parent table: set of partitions}.
+    """
+    statements = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    try:
+        async with async_session_maker() as session:
+            event.listen(engine.sync_engine, "before_cursor_execute", record)
+            try:
+                await query(session)
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+            connection = await session.connection()
+            partitions = defaultdict(set)
+            parents = {}
+            for row in await connection.execute(PARTITIONS):
+                partitions[row.parent].add(row.partition)
+                parents[row.partition] = row.parent
+            if not partitions[PRODUCT]:
+                pytest.skip("product is not partitioned yet")
+
+            scanned = defaultdict(set)
+            for statement, parameters in statements:
+                result = await connection.exec_driver_sql(
+                    f"EXPLAIN (FORMAT JSON) {statement}", tuple(parameters or ())
+                )
+                plan = result.scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                for relation in scanned_relations(plan[0]["Plan"]):
+                    if relation in parents:
+                        scanned[parents[relation]].add(relation)
+
+            await session.rollback()
+    finally:
+        await engine.dispose()
+
+    return scanned, partitions
+
+
+def explain(query):
+    return asyncio.run(explain_partitions(query))
+
+
+def test_products_by_ids_are_pruned(database):
+    scanned, partitions = explain(
+        lambda session: get_products_by_ids(session=session, product_ids=[1, 2, 3])
+    )
+
+    assert 1 <= len(scanned[PRODUCT]) <= 3 < len(partitions[PRODUCT])
+
+
+def test_product_by_id_scans_one_partition(database):
+    scanned, _ = explain(
+        lambda session: get_products_by_ids(session=session, product_ids=[1])
+    )
+
+    assert len(scanned[PRODUCT]) == 1
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        lambda session: get_products_by_category(session=session, category_id=1),
+        lambda session: get_unique_products_count(session=session, category_ids=[]),
+        lambda session: get_categories_for_products(session=session, product_ids=[1]),
+    ],
+    ids=["products_by_category", "unique_products_count", "categories_for_products"],
+)
+def test_queries_scan_every_product_partition(database, query):
+    scanned, partitions = explain(query)
+
+    assert scanned[PRODUCT] == partitions[PRODUCT]
+
+
+def test_association_by_category_ids(database):
+    scanned, partitions = explain(
+        lambda session: get_categories_by_ids(session=session, category_ids=[1])
+    )
+
+    if ASSOCIATION_PARTITIONING == "range":
+        assert len(scanned[ASSOCIATION]) < len(partitions[ASSOCIATION])
+    else:
+        assert scanned[ASSOCIATION] == partitions[ASSOCIATION]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        lambda session: get_top_product_ids_by_price(
+            session=session, category_id=1, limit=10, descending=False
+        ),
+        lambda session: get_categories_with_product_count(
+            session=session, category_ids=[1, 2]
+        ),
+    ],
+    ids=["top_products_by_price", "categories_with_count"],
+)
+def test_association_joins_scan_every_partition(database, query):
+    scanned, partitions = explain(query)
+
+    assert scanned[ASSOCIATION] == partitions[ASSOCIATION]
@@ -0,0 +1,173 @@
+import json
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import product.router
+from config import TREE_STATEMENT_TIMEOUT
+from database import get_session_with_timeout
+from main import app
+from product.router import rows_response
+from product.schemas import PRODUCT_FIELDS, ProductRows
+from product.utils import product_row
+
+
+# Category lists of every length, so offsets move by 0, 1 and several
+ROWS = [
+    SimpleNamespace(id=1, name="boots", price=59.9, category_ids=[3, 4, 5]),
+    SimpleNamespace(id=2, name="gift card", price=10.0, category_ids=[]),
+    SimpleNamespace(id=3, name="sandals", price=24.5, category_ids=[3]),
+    SimpleNamespace(id=4, name="socks", price=2.25, category_ids=[]),
+    SimpleNamespace(id=5, name="laces", price=0.99, category_ids=[6, 3]),
+]
+
+FIELD_SETS = [
+    PRODUCT_FIELDS,
+    ("id",),
+    ("id", "price"),
+    ("id", "category_ids"),
+    ("id", "name", "category_ids"),
+]
+
+
+def product_rows(fields, rows=ROWS):
+    product_rows = ProductRows(fields)
+    product_rows.extend(rows)
+    return product_rows
+
+
+def envelope(data):
+    # What the dict path returns for the same products
+    return {"status": "success", "data": data, "detail": None}
+
+
+@pytest.mark.parametrize("fields", FIELD_SETS)
+def test_rows_match_the_dict_path(fields):
+    rows = product_rows(fields)
+
+    assert len(rows) == len(ROWS)
+    assert list(rows) == [product_row(row, fields) for row in ROWS]
+
+
+def test_category_offsets_slice_each_row():
+    rows = product_rows(("id", "category_ids"))
+
+    assert rows.category_offsets.tolist() == [0, 3, 3, 4, 4, 6]
+    assert [rows.row(index)["category_ids"] for index in range(len(rows))] == [
+        [3, 4, 5],
+        [],
+        [3],
+        [],
+        [6, 3],
+    ]
+
+
+def test_extend_appends_to_earlier_batches():
+    rows = product_rows(PRODUCT_FIELDS, ROWS[:2])
+    rows.extend(ROWS[2:])
+
+    assert list(rows) == [product_row(row, PRODUCT_FIELDS) for row in ROWS]
+
+
+def test_unselected_fields_are_not_stored():
+    rows = product_rows(("id", "price"))
+
+    assert rows.names == []
+    assert rows.category_values.tolist() == []
+    assert rows.category_offsets.tolist() == [0]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 10000])
+@pytest.mark.parametrize("fields", FIELD_SETS)
+def test_json_chunks_join_into_one_array(fields, chunk_size):
+    chunks = list(product_rows(fields).json_chunks(chunk_size))
+
+    assert b"".join(chunks) == orjson.dumps(
+        [product_row(row, fields) for row in ROWS]
+    )
+
+
+def test_json_chunks_are_separated_by_commas():
+    chunks = list(product_rows(("id",)).json_chunks(chunk_size=2))
+
+    assert chunks == [
+        b"[",
+        b'{"id":1},{"id":2}',
+        b",",
+        b'{"id":3},{"id":4}',
+        b",",
+        b'{"id":5}',
+        b"]",
+    ]
+
+
+def test_json_chunks_of_no_rows():
+    assert b"".join(ProductRows().json_chunks()) == b"[]"
+
+
+@pytest.mark.parametrize("fields", FIELD_SETS)
+def test_rows_response_matches_the_dict_path(fields):
+    response = rows_response(product_rows(fields))
+    data = [product_row(row, fields) for row in ROWS]
+
+    assert response.media_type == "application/json"
+    assert response.body == orjson.dumps(envelope(data))
+    # Decodes to what the default JSON response renders for the dicts
+    assert json.loads(response.body) == json.loads(
+        JSONResponse(jsonable_encoder(envelope(data))).body
+    )
+
+
+@pytest.fixture
+def get_products_by_category(monkeypatch):
+    class Session:
+        async def rollback(self):
+            pass
+
+    calls = []
+
+    async def get_products_by_category(**kwargs):
+        calls.append(kwargs)
+        return product_rows(kwargs["fields"])
+
+    app.dependency_overrides[get_session_with_timeout(TREE_STATEMENT_TIMEOUT)] = Session
+    monkeypatch.setattr(
+        product.router, "get_products_by_category", get_products_by_category
+    )
+    yield calls
+    app.dependency_overrides.clear()
+
+
+def test_tree_endpoint_serializes_the_rows(get_products_by_category):
+    response = TestClient(app).get(
+        "/api/v1.0/products/by_category_tree",
+        params={"parent_category_id": 3, "fields": "category_ids,id"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == envelope(
+        [{"id": row.id, "category_ids": row.category_ids} for row in ROWS]
+    )
+    (call,) = get_products_by_category
+    assert call["fields"] == ["id", "category_ids"]
+    assert call["compact"] is True
+
+
+def test_tree_endpoint_without_products_returns_404(
+    monkeypatch, get_products_by_category
+):
+    async def no_products(**kwargs):
+        return ProductRows(kwargs["fields"])
+
+    monkeypatch.setattr(product.router, "get_products_by_category", no_products)
+
+    response = TestClient(app).get(
+        "/api/v1.0/products/by_category_tree", params={"parent_category_id": 3}
+    )
+
+    assert response.status_code == 404
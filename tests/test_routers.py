@@ -0,0 +1,184 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import DBAPIError, NoResultFound
+
+import cancellation
+import category.router
+import product.router
+from cancellation import QUERY_CANCELED
+from config import (
+    COUNT_STATEMENT_TIMEOUT,
+    MAX_IDS_PER_REQUEST,
+    STATEMENT_TIMEOUT,
+    TREE_STATEMENT_TIMEOUT,
+)
+from category.models import Category
+from database import get_async_session, get_session_with_timeout
+from exceptions import CategoryCycleError
+from main import app
+
+
+PRODUCTS_COUNT = "/api/v1.0/products/number_of_unique_by_categories_ids"
+CATEGORIES_COUNT = "/api/v1.0/categories/with_product_count"
+
+# The util each count endpoint awaits, replaced to stand in for the query
+COUNT_QUERIES = [
+    (PRODUCTS_COUNT, product.router, "get_unique_products_count"),
+    (CATEGORIES_COUNT, category.router, "get_categories_with_product_count"),
+]
+
+
+class Session:
+    def __init__(self):
+        self.rollbacks = 0
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+class DriverError(Exception):
+    def __init__(self, sqlstate):
+        super().__init__(sqlstate)
+        self.sqlstate = sqlstate
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = Session()
+    app.dependency_overrides[get_async_session] = lambda: session
+    for timeout in (STATEMENT_TIMEOUT, TREE_STATEMENT_TIMEOUT, COUNT_STATEMENT_TIMEOUT):
+        app.dependency_overrides[get_session_with_timeout(timeout)] = lambda: session
+    monkeypatch.setattr(cancellation, "DISCONNECT_POLL_INTERVAL", 0.01)
+
+    yield session
+
+    app.dependency_overrides.clear()
+
+
+def call_disconnected(path: str, query_string: bytes) -> dict:
+    """Call the app directly with a client that has already gone away."""
+    messages = []
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string,
+        "root_path": "",
+        "headers": [],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    asyncio.run(app(scope, receive, send))
+
+    start = next(message for message in messages if message["type"] == "http.response.start")
+    body = b"".join(
+        message.get("body", b"") for message in messages if message["type"] == "http.response.body"
+    )
+    return {"status_code": start["status"], "json": json.loads(body)}
+
+
+@pytest.mark.parametrize("path, module, query", COUNT_QUERIES)
+def test_client_disconnect_returns_499(session, monkeypatch, path, module, query):
+    cancelled = []
+
+    async def slow_query(**kwargs):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    monkeypatch.setattr(module, query, slow_query)
+
+    response = call_disconnected(path, b"category_ids=1")
+
+    assert response["status_code"] == 499
+    assert response["json"]["detail"]["detail"] == "Client closed request"
+    assert cancelled == [True]
+    assert session.rollbacks == 1
+
+
+@pytest.mark.parametrize("path, module, query", COUNT_QUERIES)
+def test_statement_timeout_returns_504(session, monkeypatch, path, module, query):
+    async def timed_out_query(**kwargs):
+        raise DBAPIError("SELECT 1", None, DriverError(QUERY_CANCELED))
+
+    monkeypatch.setattr(module, query, timed_out_query)
+
+    response = TestClient(app).get(path, params={"category_ids": [1]})
+
+    assert response.status_code == 504
+    assert response.json()["detail"]["status"] == "error"
+    assert session.rollbacks == 1
+
+
+@pytest.mark.parametrize(
+    "path, name",
+    [
+        ("/api/v1.0/products", "ids"),
+        (PRODUCTS_COUNT, "category_ids"),
+        ("/api/v1.0/categories", "ids"),
+        ("/api/v1.0/categories/by_product_ids", "product_ids"),
+        (CATEGORIES_COUNT, "category_ids"),
+    ],
+)
+def test_too_many_ids_return_422(session, path, name):
+    ids = list(range(1, MAX_IDS_PER_REQUEST + 2))
+
+    response = TestClient(app).get(path, params={name: ids})
+
+    assert response.status_code == 422
+    assert session.rollbacks == 0
+
+
+def move(session, monkeypatch, result):
+    calls = []
+
+    async def move_category(session, category_id, new_data):
+        calls.append((category_id, new_data.parent_id))
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(category.router, "move_category", move_category)
+
+    response = TestClient(app).post("/api/v1.0/categories/5/move", json={"parent_id": 2})
+
+    assert calls == [(5, 2)]
+    return response
+
+
+def test_move_returns_the_moved_category(session, monkeypatch):
+    moved = Category(name="shoes", parent_id=2)
+    moved.id = 5
+
+    response = move(session, monkeypatch, moved)
+
+    assert response.status_code == 200
+    assert response.json()["data"] == {"name": "shoes", "parent_id": 2, "id": 5}
+    assert session.rollbacks == 0
+
+
+@pytest.mark.parametrize(
+    "error, status_code",
+    [(CategoryCycleError(), 400), (NoResultFound(), 404), (RuntimeError(), 500)],
+)
+def test_move_errors(session, monkeypatch, error, status_code):
+    response = move(session, monkeypatch, error)
+
+    assert response.status_code == status_code
+    assert session.rollbacks == 1